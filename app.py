@@ -2,14 +2,15 @@ from flask import Flask, render_template, flash, redirect, url_for, request, jso
 from flask_login import LoginManager, current_user
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_migrate import Migrate
 from datetime import datetime
 from models import db, User
 import os
 from dotenv import load_dotenv
-from extensions import mail
+from extensions import mail, limiter, cache
+from utils import versioning, conditional, assets, templating, limiter_storage, rate_limits, statement_deadlines
+from utils import cache_backends, catalog, tiered_cache, fragments, counters, rollups, export_jobs, change_feed, user_search, pagination
+from utils import pools, admission, instrumentation, access_log, metrics, profiler, slow_requests, memory_tracking
 
 # Load environment variables
 load_dotenv()
@@ -34,11 +35,55 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 
+# Rate limit configuration: counters live in SQLite so every worker shares them
+os.makedirs(app.instance_path, exist_ok=True)
+app.config['RATELIMIT_STORAGE_URI'] = os.getenv(
+    'RATELIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(app.instance_path, 'ratelimit.db'))
+app.config['RATELIMIT_STRATEGY'] = os.getenv('RATELIMIT_STRATEGY', 'moving-window')
+app.config['RATELIMIT_DEFAULT'] = os.getenv('RATE_LIMIT_DEFAULT', '200 per day;50 per hour')
+app.config['RATE_LIMIT_LOGIN'] = os.getenv('RATE_LIMIT_LOGIN', '20 per hour')
+app.config['RATE_LIMIT_EXPORT'] = os.getenv('RATE_LIMIT_EXPORT', '30 per hour')
+app.config['RATE_LIMIT_COSTS'] = rate_limits.parse_costs(
+    os.getenv('RATE_LIMIT_COSTS', rate_limits.DEFAULT_COSTS))
+
+# Cache configuration: simple (per worker), filesystem, or shared (one SQLite
+# file for every worker on the host)
+app.config['CACHE_TYPE'] = cache_backends.cache_type(os.getenv('CACHE_BACKEND', 'simple'))
+app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+app.config['CACHE_DIR'] = os.getenv('CACHE_DIR', os.path.join(app.instance_path, 'cache'))
+app.config['CACHE_SQLITE_PATH'] = os.getenv('CACHE_SQLITE_PATH', os.path.join(app.instance_path, 'cache.db'))
+app.config['ANALYTICS_CACHE_TTL'] = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+app.config['ANALYTICS_CACHE_STALE'] = int(os.getenv('ANALYTICS_CACHE_STALE', 900))
+app.config['ANALYTICS_API_MAX_DAYS'] = int(os.getenv('ANALYTICS_API_MAX_DAYS', 731))
+
 # Initialize extensions
 db.init_app(app)
 csrf = CSRFProtect(app)
 mail.init_app(app)
+cache.init_app(app)
+tiered_cache.init_app(app)
+fragments.init_app(app)
 migrate = Migrate(app, db)
+versioning.init_app(app)
+catalog.init_app(app)
+counters.init_app(app)
+rollups.init_app(app)
+export_jobs.init_app(app)
+change_feed.init_app(app)
+user_search.init_app(app)
+pagination.init_app(app)
+conditional.init_app(app)
+assets.init_app(app)
+limiter_storage.init_app(app)
+pools.init_app(app)
+admission.init_app(app)
+instrumentation.init_app(app)
+access_log.init_app(app)
+metrics.init_app(app)
+profiler.init_app(app)
+slow_requests.init_app(app)
+memory_tracking.init_app(app)
+statement_deadlines.init_app(app)
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -47,11 +92,7 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 
 # Initialize rate limiter
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
-)
+limiter.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -68,6 +109,9 @@ app.register_blueprint(main_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(payment_bp)
 
+# Compile templates up front so the first request after a deploy isn't slow
+templating.init_app(app)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
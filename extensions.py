@@ -1,3 +1,8 @@
 from flask_mail import Mail
+from flask_caching import Cache
+from flask_limiter import Limiter
+from utils.rate_limits import rate_limit_key, request_cost
 
-mail = Mail()
\ No newline at end of file
+mail = Mail()
+cache = Cache()
+limiter = Limiter(key_func=rate_limit_key, default_limits_cost=request_cost)
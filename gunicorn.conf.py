@@ -0,0 +1,38 @@
+import os
+import shutil
+
+# WORKER_POOL=student or WORKER_POOL=admin starts one of the split pools
+# (see utils/pools.py and deploy/nginx.conf); each is sized on its own with
+# <POOL>_POOL_BIND, <POOL>_POOL_WORKERS and <POOL>_POOL_THREADS
+pool = os.getenv('WORKER_POOL', '')
+POOL_DEFAULTS = {
+    '': ('0.0.0.0:8000', 4),
+    'student': ('127.0.0.1:8001', 4),
+    'admin': ('127.0.0.1:8002', 1),
+}
+default_bind, default_workers = POOL_DEFAULTS.get(pool, ('127.0.0.1:8003', 1))
+
+def setting(name, unpooled_name, default):
+    return os.getenv(f'{pool.upper()}_POOL_{name}' if pool else unpooled_name, default)
+
+bind = setting('BIND', 'GUNICORN_BIND', default_bind)
+workers = int(setting('WORKERS', 'WEB_CONCURRENCY', default_workers))
+# Threads beyond ADMISSION_CONCURRENCY are where requests queue by priority
+# (see utils/admission.py); more than one thread switches to gthread workers
+threads = int(setting('THREADS', 'GUNICORN_THREADS', 16))
+proc_name = f'messmate-{pool}' if pool else 'messmate'
+
+# prometheus_client picks its multiprocess mode at import time, so this has
+# to be in the environment before the workers import the app. Each pool
+# keeps its own directory and is scraped on its own port.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join('instance', 'prometheus', pool or 'default'))
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be summed into this one
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,123 @@
+"""baseline schema
+
+Revision ID: a1c3e5f70b21
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70b21'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# The tables as they were before migrations existed. Databases made with
+# db.create_all() already have them and only get the revision recorded.
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('users'):
+        op.create_table('users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=128), nullable=True),
+            sa.Column('role', sa.String(length=20), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_login', sa.DateTime(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('email_verified', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username')
+        )
+    if not _has_table('meal_plans'):
+        op.create_table('meal_plans',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('duration', sa.Integer(), nullable=False),
+            sa.Column('meals_included', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('subscriptions'):
+        op.create_table('subscriptions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('plan_type', sa.String(length=20), nullable=False),
+            sa.Column('start_date', sa.DateTime(), nullable=False),
+            sa.Column('end_date', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('stripe_subscription_id', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('stripe_subscription_id')
+        )
+    if not _has_table('meals'):
+        op.create_table('meals',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('meal_type', sa.String(length=20), nullable=False),
+            sa.Column('meal_date', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('payment_status', sa.String(length=20), nullable=True),
+            sa.Column('dietary_preferences', sa.String(length=200), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('subscription_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('payments'):
+        op.create_table('payments',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.Column('payment_type', sa.String(length=20), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('stripe_payment_id', sa.String(length=100), nullable=True),
+            sa.Column('stripe_refund_id', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('subscription_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('stripe_payment_id'),
+            sa.UniqueConstraint('stripe_refund_id')
+        )
+    if not _has_table('refund_requests'):
+        op.create_table('refund_requests',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('payment_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('reason', sa.Text(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('processed_at', sa.DateTime(), nullable=True),
+            sa.Column('processed_by', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['payment_id'], ['payments.id']),
+            sa.ForeignKeyConstraint(['processed_by'], ['users.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('refund_requests')
+    op.drop_table('payments')
+    op.drop_table('meals')
+    op.drop_table('subscriptions')
+    op.drop_table('meal_plans')
+    op.drop_table('users')
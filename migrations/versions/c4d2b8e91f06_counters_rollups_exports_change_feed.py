@@ -0,0 +1,197 @@
+"""counters, rollups, export jobs and change feed
+
+Revision ID: c4d2b8e91f06
+Revises: a1c3e5f70b21
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2b8e91f06'
+down_revision = 'a1c3e5f70b21'
+branch_labels = None
+depends_on = None
+
+# Tables and columns added for the admin counters, cache invalidation, data
+# versions, analytics rollups, export jobs and the change feed. Databases
+# where `python app.py` or database_setup.py already created some of them
+# with db.create_all() only get what's missing.
+
+CHANGE_FEED_TABLES = ('users', 'meals', 'payments', 'subscriptions')
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _has_table(name):
+    return _inspector().has_table(name)
+
+
+def _has_column(table, column):
+    return column in {col['name'] for col in _inspector().get_columns(table)}
+
+
+def _has_index(table, name):
+    return name in {index['name'] for index in _inspector().get_indexes(table)}
+
+
+def _create_index(name, table, columns, unique=False):
+    if not _has_index(table, name):
+        op.create_index(name, table, columns, unique=unique)
+
+
+def upgrade():
+    if not _has_table('data_versions'):
+        op.create_table('data_versions',
+            sa.Column('scope', sa.String(length=64), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('scope')
+        )
+    if not _has_table('cache_invalidations'):
+        op.create_table('cache_invalidations',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    _create_index('ix_cache_invalidations_created_at', 'cache_invalidations', ['created_at'])
+    _create_index('ix_cache_invalidations_key', 'cache_invalidations', ['key'])
+    if not _has_table('admin_counters'):
+        op.create_table('admin_counters',
+            sa.Column('name', sa.String(length=64), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+    if not _has_table('meal_daily_rollups'):
+        op.create_table('meal_daily_rollups',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('meal_type', sa.String(length=20), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('plan_type', sa.String(length=20), nullable=False),
+            sa.Column('meals', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'meal_type', 'status', 'plan_type')
+        )
+    if not _has_table('revenue_daily_rollups'):
+        op.create_table('revenue_daily_rollups',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('payment_type', sa.String(length=20), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('plan_type', sa.String(length=20), nullable=False),
+            sa.Column('payments', sa.Integer(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'payment_type', 'status', 'plan_type')
+        )
+    if not _has_table('rollup_changes'):
+        op.create_table('rollup_changes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('rollup_state'):
+        op.create_table('rollup_state',
+            sa.Column('name', sa.String(length=64), nullable=False),
+            sa.Column('watermark', sa.Integer(), nullable=False),
+            sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+            sa.Column('claimed_until', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+    elif not _has_column('rollup_state', 'claimed_until'):
+        op.add_column('rollup_state', sa.Column('claimed_until', sa.DateTime(), nullable=True))
+    if not _has_table('export_jobs'):
+        op.create_table('export_jobs',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('active_key', sa.String(length=40), nullable=True),
+            sa.Column('data_type', sa.String(length=20), nullable=False),
+            sa.Column('format', sa.String(length=20), nullable=False),
+            sa.Column('compressed', sa.Boolean(), nullable=True),
+            sa.Column('start_date', sa.Date(), nullable=True),
+            sa.Column('end_date', sa.Date(), nullable=True),
+            sa.Column('partition', sa.String(length=10), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('size', sa.Integer(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('requested_by', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['requested_by'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('active_key')
+        )
+    _create_index('ix_export_jobs_expires_at', 'export_jobs', ['expires_at'])
+
+    # Date range filters for rollups, analytics and exports
+    _create_index('ix_meals_meal_date', 'meals', ['meal_date'])
+    _create_index('ix_payments_created_at', 'payments', ['created_at'])
+
+    # Meals and payments from before the rollup change log are counted here,
+    # once; refresh-rollups then only applies logged changes. Skipped if a
+    # rebuild has already run on this database.
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT 1 FROM rollup_state WHERE name = 'daily'")).first() is None:
+        op.execute('DELETE FROM meal_daily_rollups')
+        op.execute('DELETE FROM revenue_daily_rollups')
+        op.execute(
+            "INSERT INTO meal_daily_rollups (day, meal_type, status, plan_type, meals) "
+            "SELECT date(m.meal_date), m.meal_type, COALESCE(m.status, 'pending'), "
+            "COALESCE(s.plan_type, 'one-time'), COUNT(m.id) "
+            "FROM meals m LEFT JOIN subscriptions s ON m.subscription_id = s.id "
+            "GROUP BY date(m.meal_date), m.meal_type, COALESCE(m.status, 'pending'), COALESCE(s.plan_type, 'one-time')"
+        )
+        op.execute(
+            "INSERT INTO revenue_daily_rollups (day, payment_type, status, plan_type, payments, amount) "
+            "SELECT date(p.created_at), p.payment_type, COALESCE(p.status, 'pending'), "
+            "COALESCE(s.plan_type, 'one-time'), COUNT(p.id), COALESCE(SUM(p.amount), 0) "
+            "FROM payments p LEFT JOIN subscriptions s ON p.subscription_id = s.id "
+            "WHERE p.created_at IS NOT NULL "
+            "GROUP BY date(p.created_at), p.payment_type, COALESCE(p.status, 'pending'), COALESCE(s.plan_type, 'one-time')"
+        )
+        op.execute('DELETE FROM rollup_changes')
+        state = sa.table('rollup_state', sa.column('name', sa.String()), sa.column('watermark', sa.Integer()),
+                         sa.column('refreshed_at', sa.DateTime()))
+        op.execute(state.insert().values(name='daily', watermark=0, refreshed_at=datetime.utcnow()))
+
+    # Existing rows go into the change feed at position 0, ahead of
+    # everything committed from now on
+    now = datetime.utcnow()
+    for table in CHANGE_FEED_TABLES:
+        if not _has_column(table, 'updated_at'):
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        if not _has_column(table, 'change_seq'):
+            op.add_column(table, sa.Column('change_seq', sa.Integer(), nullable=True))
+        rows = sa.table(table, sa.column('created_at', sa.DateTime()), sa.column('updated_at', sa.DateTime()),
+                        sa.column('change_seq', sa.Integer()))
+        op.execute(rows.update().where(rows.c.updated_at.is_(None))
+                   .values(updated_at=sa.func.coalesce(rows.c.created_at, now)))
+        op.execute(rows.update().where(rows.c.change_seq.is_(None)).values(change_seq=0))
+        if _has_index(table, f'ix_{table}_updated_at'):
+            op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        _create_index(f'ix_{table}_change_seq', table, ['change_seq'])
+
+
+def downgrade():
+    for table in CHANGE_FEED_TABLES:
+        op.drop_index(f'ix_{table}_change_seq', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('change_seq')
+            batch_op.drop_column('updated_at')
+    op.drop_index('ix_payments_created_at', table_name='payments')
+    op.drop_index('ix_meals_meal_date', table_name='meals')
+    op.drop_index('ix_export_jobs_expires_at', table_name='export_jobs')
+    op.drop_table('export_jobs')
+    op.drop_table('rollup_state')
+    op.drop_table('rollup_changes')
+    op.drop_table('revenue_daily_rollups')
+    op.drop_table('meal_daily_rollups')
+    op.drop_table('admin_counters')
+    op.drop_index('ix_cache_invalidations_key', table_name='cache_invalidations')
+    op.drop_index('ix_cache_invalidations_created_at', table_name='cache_invalidations')
+    op.drop_table('cache_invalidations')
+    op.drop_table('data_versions')
@@ -0,0 +1,58 @@
+"""user search index
+
+Revision ID: e7a91f3c5d24
+Revises: c4d2b8e91f06
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a91f3c5d24'
+down_revision = 'c4d2b8e91f06'
+branch_labels = None
+depends_on = None
+
+# user_search, the FTS5 trigram index behind the admin user search (see
+# utils/user_search.py), and the triggers that keep it in step with users.
+# SQLite only: on other databases searches use ILIKE, and on PostgreSQL
+# `flask rebuild-user-search` adds the pg_trgm indexes. The DDL is copied
+# rather than imported so this revision stays as it was written.
+
+TRIGGERS = ('user_search_insert', 'user_search_delete', 'user_search_update')
+
+SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        username, email, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON users BEGIN
+        INSERT INTO user_search (rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON users BEGIN
+        INSERT INTO user_search (user_search, rowid, username, email)
+        VALUES ('delete', old.id, old.username, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_update AFTER UPDATE OF username, email ON users BEGIN
+        INSERT INTO user_search (user_search, rowid, username, email)
+        VALUES ('delete', old.id, old.username, old.email);
+        INSERT INTO user_search (rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in SQLITE_DDL:
+        op.execute(statement)
+    # Indexes the users that are already there
+    op.execute("INSERT INTO user_search (user_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for trigger in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    op.execute('DROP TABLE IF EXISTS user_search')
@@ -13,6 +13,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128))
     role = db.Column(db.String(20), default='student')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # set at commit, see utils/change_feed.py
+    change_seq = db.Column(db.Integer, index=True)
     last_login = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=False)
     email_verified = db.Column(db.Boolean, default=False)
@@ -33,11 +35,15 @@ class Meal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     meal_type = db.Column(db.String(20), nullable=False)  # breakfast, lunch, dinner
-    meal_date = db.Column(db.DateTime, nullable=False)
+    # active_history: the old value is loaded into the attribute's history
+    # when it's set while expired, for utils/counters.py and utils/rollups.py
+    meal_date = db.column_property(db.Column(db.DateTime, nullable=False, index=True), active_history=True)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, cancelled
     payment_status = db.Column(db.String(20), default='unpaid')  # unpaid, paid, refunded
     dietary_preferences = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # set at commit, see utils/change_feed.py
+    change_seq = db.Column(db.Integer, index=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)
 
 class Subscription(db.Model):
@@ -47,9 +53,11 @@ class Subscription(db.Model):
     plan_type = db.Column(db.String(20), nullable=False)  # weekly, monthly
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(20), default='active')  # active, expired, cancelled
+    status = db.column_property(db.Column(db.String(20), default='active'), active_history=True)  # active, expired, cancelled
     stripe_subscription_id = db.Column(db.String(100), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # set at commit, see utils/change_feed.py
+    change_seq = db.Column(db.Integer, index=True)
     
     # Relationship with meals
     meals = db.relationship('Meal', backref='subscription', lazy=True)
@@ -63,7 +71,9 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed, refunded
     stripe_payment_id = db.Column(db.String(100), unique=True)
     stripe_refund_id = db.Column(db.String(100), unique=True, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.column_property(db.Column(db.DateTime, default=datetime.utcnow, index=True), active_history=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # set at commit, see utils/change_feed.py
+    change_seq = db.Column(db.Integer, index=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)
 
 class MealPlan(db.Model):
@@ -83,7 +93,74 @@ class RefundRequest(db.Model):
     payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     reason = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
+    status = db.column_property(db.Column(db.String(20), default='pending'), active_history=True)  # pending, approved, rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime)
-    processed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
\ No newline at end of file
+    processed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(64), primary_key=True)  # table name or user:<id>
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class CacheInvalidation(db.Model):
+    __tablename__ = 'cache_invalidations'
+    id = db.Column(db.Integer, primary_key=True)  # workers poll for ids they haven't seen
+    key = db.Column(db.String(255), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class AdminCounter(db.Model):
+    __tablename__ = 'admin_counters'
+    name = db.Column(db.String(64), primary_key=True)  # e.g. users, meals_on:2024-01-31
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class MealRollup(db.Model):
+    __tablename__ = 'meal_daily_rollups'
+    day = db.Column(db.Date, primary_key=True)
+    meal_type = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    plan_type = db.Column(db.String(20), primary_key=True)  # subscription plan, or one-time
+    meals = db.Column(db.Integer, nullable=False, default=0)
+
+class RevenueRollup(db.Model):
+    __tablename__ = 'revenue_daily_rollups'
+    day = db.Column(db.Date, primary_key=True)
+    payment_type = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    plan_type = db.Column(db.String(20), primary_key=True)  # subscription plan, or one-time
+    payments = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class RollupChange(db.Model):
+    __tablename__ = 'rollup_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # meals or revenue
+    day = db.Column(db.Date, nullable=False)
+
+class RollupState(db.Model):
+    __tablename__ = 'rollup_state'
+    name = db.Column(db.String(64), primary_key=True)
+    watermark = db.Column(db.Integer, nullable=False, default=0)  # last rollup_changes id applied
+    refreshed_at = db.Column(db.DateTime)  # last refresh or rebuild
+    claimed_until = db.Column(db.DateTime)  # set while a refresh or rebuild runs
+
+class ExportJob(db.Model):
+    __tablename__ = 'export_jobs'
+    id = db.Column(db.String(32), primary_key=True)  # random, used in download URLs
+    # Set while the job is queued, running or its file is kept; unique so
+    # identical concurrent requests share one job
+    active_key = db.Column(db.String(40), unique=True, nullable=True)
+    data_type = db.Column(db.String(20), nullable=False)
+    format = db.Column(db.String(20), nullable=False)
+    compressed = db.Column(db.Boolean, default=False)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    partition = db.Column(db.String(10))
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    size = db.Column(db.Integer, default=0)  # bytes written so far
+    error = db.Column(db.Text)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
@@ -1,9 +1,24 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+import os
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort, Response, stream_with_context, send_file
 from flask_login import login_required, current_user
-from models import db, User, Meal, Subscription, Payment, MealPlan, RefundRequest
+from models import db, User, Payment, MealPlan, RefundRequest, MealRollup, RevenueRollup, ExportJob
 from routes.auth import admin_required
+from extensions import limiter
+from utils.rate_limits import config_limit, request_cost
+from utils.profiler import collapsed_stacks, speedscope
+from utils.slow_requests import endpoint_summary
 from sqlalchemy import func
 from datetime import datetime, timedelta
+from utils.conditional import conditional_view
+from utils.tiered_cache import tiered_cache
+from utils.counters import dashboard_counters
+from utils.rollups import refresh_rollups
+from utils.analytics import GRANULARITIES, AnalyticsQueryError, analytics_series, parse_query
+from utils.exports import EXPORTS, FORMATS, COLUMNAR_FORMATS, columnar_available, export_filename, export_scope, export_stream, parse_day
+from utils.export_jobs import job_filename, job_path, job_status, submit_export
+from utils.change_feed import TRACKED, CursorError, changes_page
+from utils.user_search import search_users
+from utils.pagination import paginate
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -11,25 +26,17 @@ admin_bp = Blueprint('admin', __name__)
 @login_required
 @admin_required
 def admin_dashboard():
-    # Get summary statistics
-    total_users = User.query.count()
-    active_subscriptions = Subscription.query.filter_by(status='active').count()
-    total_meals_today = Meal.query.filter(
-        func.date(Meal.meal_date) == func.date(datetime.utcnow())
-    ).count()
-    pending_refunds = RefundRequest.query.filter_by(status='pending').count()
+    # Get summary statistics, kept up to date by utils/counters.py
+    counters = dashboard_counters()
     
     # Get recent activities
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     recent_payments = Payment.query.order_by(Payment.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html',
-                           total_users=total_users,
-                           active_subscriptions=active_subscriptions,
-                           total_meals_today=total_meals_today,
-                           pending_refunds=pending_refunds,
                            recent_users=recent_users,
-                           recent_payments=recent_payments)
+                           recent_payments=recent_payments,
+                           **counters)
 
 @admin_bp.route('/admin/users')
 @login_required
@@ -40,13 +47,11 @@ def manage_users():
     
     query = User.query
     if search:
-        query = query.filter(
-            (User.username.ilike(f'%{search}%')) |
-            (User.email.ilike(f'%{search}%'))
-        )
+        # Best matches first, newest first among equals
+        query = search_users(query, search)
     
-    users = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    users = paginate(query.order_by(User.created_at.desc()), page, 20, scope='users',
+                     count_key=f'search={search}', exact=request.args.get('exact') == '1')
     
     return render_template('admin/users.html', users=users)
 
@@ -107,8 +112,9 @@ def manage_refunds():
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    refund_requests = query.order_by(RefundRequest.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    refund_requests = paginate(query.order_by(RefundRequest.created_at.desc()), page, 20,
+                               scope='refund_requests', count_key=f'status={status_filter}',
+                               exact=request.args.get('exact') == '1')
     
     return render_template('admin/refunds.html', refund_requests=refund_requests)
 
@@ -143,68 +149,214 @@ def process_refund(request_id):
 @login_required
 @admin_required
 def analytics():
-    # Get date range
-    end_date = datetime.utcnow()
+    summary = tiered_cache.get_or_compute('analytics:summary', analytics_summary,
+                                          ttl=current_app.config['ANALYTICS_CACHE_TTL'],
+                                          stale_ttl=current_app.config['ANALYTICS_CACHE_STALE'])
+    return render_template('admin/analytics.html', **summary)
+
+@admin_bp.route('/admin/api/analytics')
+@login_required
+@admin_required
+def analytics_api():
+    try:
+        query = parse_query(request.args, current_app.config['ANALYTICS_API_MAX_DAYS'])
+    except AnalyticsQueryError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    def compute():
+        refresh_rollups()
+        return analytics_series(query)
+
+    return jsonify(tiered_cache.get_or_compute(query.cache_key(), compute,
+                                               ttl=current_app.config['ANALYTICS_CACHE_TTL'],
+                                               stale_ttl=current_app.config['ANALYTICS_CACHE_STALE']))
+
+def analytics_summary():
+    # Bring the rollups up to date, then read them: one row per day and
+    # dimension, however many meals and payments there are
+    refresh_rollups()
+    end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=30)
     
     # Daily meal counts
     daily_meals = db.session.query(
-        func.date(Meal.meal_date),
-        func.count(Meal.id)
+        MealRollup.day,
+        func.sum(MealRollup.meals)
     ).filter(
-        Meal.meal_date.between(start_date, end_date)
+        MealRollup.day.between(start_date, end_date)
     ).group_by(
-        func.date(Meal.meal_date)
-    ).all()
+        MealRollup.day
+    ).order_by(MealRollup.day).all()
     
     # Revenue statistics
-    total_revenue = db.session.query(func.sum(Payment.amount)).\
-        filter(Payment.status == 'completed').scalar() or 0
+    total_revenue = db.session.query(func.sum(RevenueRollup.amount)).\
+        filter(RevenueRollup.status == 'completed').scalar() or 0
     
-    subscription_revenue = db.session.query(func.sum(Payment.amount)).\
-        filter(Payment.payment_type == 'subscription',
-               Payment.status == 'completed').scalar() or 0
+    subscription_revenue = db.session.query(func.sum(RevenueRollup.amount)).\
+        filter(RevenueRollup.payment_type == 'subscription',
+               RevenueRollup.status == 'completed').scalar() or 0
     
     one_time_revenue = total_revenue - subscription_revenue
     
     # Popular meal types
     meal_type_stats = db.session.query(
-        Meal.meal_type,
-        func.count(Meal.id)
-    ).group_by(Meal.meal_type).all()
+        MealRollup.meal_type,
+        func.sum(MealRollup.meals)
+    ).group_by(MealRollup.meal_type).all()
     
-    return render_template('admin/analytics.html',
-                           daily_meals=daily_meals,
-                           total_revenue=total_revenue,
-                           subscription_revenue=subscription_revenue,
-                           one_time_revenue=one_time_revenue,
-                           meal_type_stats=meal_type_stats)
+    # Plain tuples so the result can be pickled into the shared cache
+    return dict(daily_meals=[tuple(row) for row in daily_meals],
+                total_revenue=total_revenue,
+                subscription_revenue=subscription_revenue,
+                one_time_revenue=one_time_revenue,
+                meal_type_stats=[tuple(row) for row in meal_type_stats])
 
 @admin_bp.route('/admin/export-data')
 @login_required
 @admin_required
+@limiter.limit(config_limit('RATE_LIMIT_EXPORT'), override_defaults=False, cost=request_cost)
+@conditional_view(lambda: [export_scope(request.args.get('type', ''))], per_user=False)
 def export_data():
     data_type = request.args.get('type')
+    fmt = request.args.get('format', 'json')
+    compress = request.args.get('gzip') in ('1', 'true')
     
-    if data_type == 'users':
-        users = User.query.all()
-        data = [{
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'created_at': user.created_at.isoformat()
-        } for user in users]
-    elif data_type == 'meals':
-        meals = Meal.query.all()
-        data = [{
-            'id': meal.id,
-            'user_id': meal.user_id,
-            'meal_type': meal.meal_type,
-            'meal_date': meal.meal_date.isoformat(),
-            'status': meal.status
-        } for meal in meals]
-    else:
+    if data_type not in EXPORTS:
         return jsonify({'error': 'Invalid data type'}), 400
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    if fmt in COLUMNAR_FORMATS and not columnar_available():
+        return jsonify({'error': 'Parquet and Arrow exports need pyarrow installed'}), 501
+    if fmt in COLUMNAR_FORMATS:
+        compress = False  # compressed inside the file
+    try:
+        start = parse_day(request.args.get('start'))
+        end = parse_day(request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+    partition = request.args.get('partition') or None
+    if partition is not None and partition not in GRANULARITIES:
+        return jsonify({'error': 'Invalid partition'}), 400
+    
+    if request.args.get('mode') == 'job':
+        job, created = submit_export(data_type, fmt, compress, start, end, partition, current_user.id)
+        response = jsonify(export_job_response(job))
+        response.status_code = 202 if job.status in ('queued', 'running') else 200
+        response.headers['Location'] = url_for('admin.export_job', job_id=job.id)
+        return response
+    
+    # Streamed row by row; the request context (and its database session)
+    # stays open until the last row has been sent
+    response = Response(stream_with_context(export_stream(data_type, fmt, compress, start, end, partition)),
+                        mimetype='application/gzip' if compress else FORMATS[fmt][0])
+    if compress or fmt != 'json':
+        response.headers['Content-Disposition'] = f'attachment; filename={export_filename(data_type, fmt, compress)}'
+    return response
+
+@admin_bp.route('/admin/api/changes')
+@login_required
+@admin_required
+def export_changes():
+    data_type = request.args.get('type')
+    if data_type not in TRACKED:
+        return jsonify({'error': 'Invalid data type'}), 400
+    try:
+        limit = int(request.args.get('limit', current_app.config['CHANGE_FEED_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    limit = max(1, min(limit, current_app.config['CHANGE_FEED_MAX_PAGE_SIZE']))
+    try:
+        rows, cursor, has_more = changes_page(data_type, request.args.get('cursor'), limit)
+    except CursorError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({'type': data_type, 'rows': rows, 'cursor': cursor, 'has_more': has_more})
+
+def export_job_response(job):
+    status = job_status(job)
+    status['status_url'] = url_for('admin.export_job', job_id=job.id)
+    if job.status == 'done':
+        status['download_url'] = url_for('admin.download_export', job_id=job.id)
+    return status
+
+@admin_bp.route('/admin/export-jobs/<job_id>')
+@login_required
+@admin_required
+def export_job(job_id):
+    job = db.get_or_404(ExportJob, job_id)
+    return jsonify(export_job_response(job))
+
+@admin_bp.route('/admin/export-jobs/<job_id>/download')
+@login_required
+@admin_required
+def download_export(job_id):
+    job = db.get_or_404(ExportJob, job_id)
+    if job.status != 'done':
+        return jsonify(export_job_response(job)), 409
+    path = job_path(job)
+    if not os.path.exists(path):
+        abort(404)
+    mimetype = 'application/gzip' if job.compressed else FORMATS[job.format][0]
+    accel_prefix = current_app.config['EXPORT_ACCEL_PREFIX']
+    if accel_prefix:
+        # nginx serves the file itself, with sendfile and Range support
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + os.path.basename(path)
+        response.headers['Content-Disposition'] = f'attachment; filename={job_filename(job)}'
+        return response
+    # Range requests and If-Range are handled by send_file; whole-file
+    # responses go out through the server's file wrapper (sendfile)
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=job_filename(job),
+                     conditional=True, max_age=0)
+
+@admin_bp.route('/admin/profiles')
+@login_required
+@admin_required
+def profiles():
+    recent_profiles = current_app.extensions['profiles'].records()
+    return render_template('admin/profiles.html', profiles=recent_profiles)
+
+@admin_bp.route('/admin/profiles/<profile_id>/<fmt>')
+@login_required
+@admin_required
+def download_profile(profile_id, fmt):
+    profile = current_app.extensions['profiles'].get(profile_id)
+    if profile is None:
+        abort(404)
     
-    return jsonify(data)
\ No newline at end of file
+    if fmt == 'speedscope':
+        response = jsonify(speedscope(profile))
+        filename = f'{profile_id}.speedscope.json'
+    elif fmt == 'collapsed':
+        response = Response(collapsed_stacks(profile), mimetype='text/plain')
+        filename = f'{profile_id}.collapsed.txt'
+    else:
+        abort(404)
+    
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@admin_bp.route('/admin/slow-requests')
+@login_required
+@admin_required
+def slow_requests():
+    view = request.args.get('view', '')
+    
+    records = list(current_app.extensions['slow_requests'].records())
+    summary = endpoint_summary(records)
+    if view:
+        records = [r for r in records if (r['endpoint'] or '-') == view]
+    
+    return render_template('admin/slow_requests.html',
+                           records=records,
+                           summary=summary,
+                           view=view,
+                           threshold_ms=current_app.config['SLOW_REQUEST_THRESHOLD_MS'])
+
+@admin_bp.route('/admin/slow-requests/<record_id>')
+@login_required
+@admin_required
+def slow_request_detail(record_id):
+    record = current_app.extensions['slow_requests'].get(record_id)
+    if record is None:
+        abort(404)
+    return render_template('admin/slow_request.html', record=record)
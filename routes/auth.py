@@ -3,7 +3,9 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from models import db, User
 from flask_mail import Message
-from extensions import mail
+from extensions import mail, limiter
+from utils.rate_limits import config_limit, login_key, request_cost
+from utils.instrumentation import external_call
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
@@ -50,6 +52,8 @@ def register():
     return render_template('auth/register.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit(config_limit('RATE_LIMIT_LOGIN'), key_func=login_key, methods=['POST'],
+               override_defaults=False, cost=request_cost)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -176,7 +180,8 @@ def send_verification_email(email, token):
     
     If you did not make this request then simply ignore this email.
     '''
-    mail.send(msg)
+    with external_call('smtp', 'verification_email'):
+        mail.send(msg)
 
 def send_password_reset_email(email, token):
     msg = Message('Password Reset Request',
@@ -187,4 +192,5 @@ def send_password_reset_email(email, token):
     
     If you did not make this request then simply ignore this email.
     '''
-    mail.send(msg)
\ No newline at end of file
+    with external_call('smtp', 'password_reset_email'):
+        mail.send(msg)
\ No newline at end of file
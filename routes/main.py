@@ -1,8 +1,12 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from models import db, Meal, Subscription, Payment, MealPlan
+from models import db, Meal, Subscription, Payment
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_
+from utils.conditional import conditional_view
+from utils.catalog import active_meal_plans
+from utils.fragments import cached_fragment
+from markupsafe import Markup
 
 main_bp = Blueprint('main', __name__)
 
@@ -14,17 +18,18 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@conditional_view(bucket_seconds=3600)  # upcoming meals roll over on the hour
 def dashboard():
-    # Get active subscription
-    active_subscription = Subscription.query.filter(
-        and_(
-            Subscription.user_id == current_user.id,
-            Subscription.status == 'active',
-            Subscription.end_date > datetime.utcnow()
-        )
-    ).first()
-    
-    # Get upcoming meals
+    # Each section is rendered once per change to the user's data and then
+    # served from the fragment cache, so a warm view runs no queries here
+    fragments = {
+        'upcoming': cached_fragment('upcoming_meals', render_upcoming_meals),
+        'subscription': cached_fragment('subscription', render_subscription),
+        'payments': cached_fragment('recent_payments', render_recent_payments),
+    }
+    return render_template('main/dashboard.html', fragments=fragments)
+
+def render_upcoming_meals():
     upcoming_meals = Meal.query.filter(
         and_(
             Meal.user_id == current_user.id,
@@ -32,17 +37,28 @@ def dashboard():
             Meal.status != 'cancelled'
         )
     ).order_by(Meal.meal_date).limit(5).all()
-    
-    # Get recent payments for the current user
+    return Markup(render_template('main/_dashboard_upcoming.html', upcoming_meals=upcoming_meals))
+
+def render_subscription():
+    active_subscription = Subscription.query.filter(
+        and_(
+            Subscription.user_id == current_user.id,
+            Subscription.status == 'active',
+            Subscription.end_date > datetime.utcnow()
+        )
+    ).first()
+    # The quick-actions bar changes with the subscription card
+    return {
+        'card': Markup(render_template('main/_dashboard_subscription.html', subscription=active_subscription)),
+        'action': Markup(render_template('main/_dashboard_action.html', subscription=active_subscription)),
+    }
+
+def render_recent_payments():
     recent_payments = Payment.query.filter_by(user_id=current_user.id)\
         .order_by(Payment.created_at.desc())\
         .limit(5)\
         .all()
-    
-    return render_template('main/dashboard.html', 
-                           subscription=active_subscription,
-                           upcoming_meals=upcoming_meals,
-                           recent_payments=recent_payments)
+    return Markup(render_template('main/_dashboard_payments.html', recent_payments=recent_payments))
 
 @main_bp.route('/meal-booking', methods=['GET', 'POST'])
 @login_required
@@ -55,11 +71,12 @@ def meal_booking():
         else:
             return handle_one_time_booking()
     
-    meal_plans = MealPlan.query.filter_by(is_active=True).all()
+    meal_plans = active_meal_plans()
     return render_template('main/meal_booking.html', meal_plans=meal_plans)
 
 @main_bp.route('/meal-history')
 @login_required
+@conditional_view(bucket_seconds=3600)
 def meal_history():
     page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
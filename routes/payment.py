@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from models import db, Payment, Meal, Subscription
 import stripe
 from datetime import datetime
+from utils.instrumentation import external_call
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -28,23 +29,24 @@ def process_payment(meal_id):
     
     try:
         # Create Stripe Checkout Session
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'usd',
-                    'unit_amount': int(amount * 100),  # Convert to cents
-                    'product_data': {
-                        'name': f'{meal.meal_type.capitalize()} - {meal.meal_date.strftime("%Y-%m-%d")}',
+        with external_call('stripe', 'checkout.session.create'):
+            checkout_session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[{
+                    'price_data': {
+                        'currency': 'usd',
+                        'unit_amount': int(amount * 100),  # Convert to cents
+                        'product_data': {
+                            'name': f'{meal.meal_type.capitalize()} - {meal.meal_date.strftime("%Y-%m-%d")}',
+                        },
                     },
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=url_for('payment.payment_success', meal_id=meal.id, _external=True),
-            cancel_url=url_for('payment.payment_cancel', meal_id=meal.id, _external=True),
-            client_reference_id=str(meal.id)
-        )
+                    'quantity': 1,
+                }],
+                mode='payment',
+                success_url=url_for('payment.payment_success', meal_id=meal.id, _external=True),
+                cancel_url=url_for('payment.payment_cancel', meal_id=meal.id, _external=True),
+                client_reference_id=str(meal.id)
+            )
         
         # Create payment record
         payment = Payment(
@@ -73,17 +75,18 @@ def create_subscription():
     
     try:
         # Create Stripe Checkout Session for subscription
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price': price_id,
-                'quantity': 1,
-            }],
-            mode='subscription',
-            success_url=url_for('payment.subscription_success', _external=True),
-            cancel_url=url_for('payment.subscription_cancel', _external=True),
-            client_reference_id=str(current_user.id)
-        )
+        with external_call('stripe', 'checkout.session.create'):
+            checkout_session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[{
+                    'price': price_id,
+                    'quantity': 1,
+                }],
+                mode='subscription',
+                success_url=url_for('payment.subscription_success', _external=True),
+                cancel_url=url_for('payment.subscription_cancel', _external=True),
+                client_reference_id=str(current_user.id)
+            )
         
         return redirect(checkout_session.url)
         
@@ -176,9 +179,10 @@ def handle_subscription_cancellation(stripe_subscription):
 
 def process_refund(payment):
     try:
-        refund = stripe.Refund.create(
-            payment_intent=payment.stripe_payment_id
-        )
+        with external_call('stripe', 'refund.create'):
+            refund = stripe.Refund.create(
+                payment_intent=payment.stripe_payment_id
+            )
         
         payment.status = 'refunded'
         payment.stripe_refund_id = refund.id
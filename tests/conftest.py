@@ -0,0 +1,72 @@
+import os
+import tempfile
+import pytest
+
+# app.py configures itself from the environment at import time, so point
+# everything it writes at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix='messmate-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'test.db')
+os.environ['RATELIMIT_STORAGE_URI'] = 'sqlite:///' + os.path.join(_scratch, 'ratelimit.db')
+os.environ['CACHE_BACKEND'] = 'simple'
+os.environ['ACCESS_LOG_PATH'] = os.path.join(_scratch, 'access.log')
+os.environ['EXPORT_DIR'] = os.path.join(_scratch, 'exports')
+os.environ['PROFILER_DIR'] = os.path.join(_scratch, 'profiles')
+os.environ['SLOW_REQUEST_DIR'] = os.path.join(_scratch, 'slow_requests')
+os.environ['MEMORY_DUMP_DIR'] = os.path.join(_scratch, 'memory_dumps')
+os.environ['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(_scratch, 'jinja_cache')
+os.environ['TEMPLATE_WARMUP'] = 'False'
+
+from datetime import datetime
+from sqlalchemy import text
+from app import app as flask_app
+from extensions import cache, limiter
+from models import db, User
+from utils import user_search
+from utils.tiered_cache import tiered_cache
+
+@pytest.fixture
+def app():
+    # No app context is left pushed: requests made with the test client
+    # would share it, and with it g (so the logged-in user) and the session
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.session.execute(text('DROP TABLE IF EXISTS user_search'))
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        cache.clear()
+        limiter.reset()
+        user_search._index_ready.clear()
+        tiered_cache.pid = None  # drops the worker-local tier
+    yield flask_app
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+_password_hash = None
+
+def make_user(username, role='student'):
+    # Every test user's password is 'password'; hashing it once keeps the
+    # suite fast
+    global _password_hash
+    user = User(username=username, email=f'{username}@example.com', role=role,
+                is_active=True, email_verified=True, created_at=datetime.utcnow())
+    if _password_hash is None:
+        user.set_password('password')
+        _password_hash = user.password_hash
+    user.password_hash = _password_hash
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': 'password'})
+    assert response.status_code == 302
+    return client
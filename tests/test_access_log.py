@@ -0,0 +1,53 @@
+import json
+from conftest import make_user, login
+from utils.access_log import endpoint_percentiles, read_entries
+
+def _flush(app):
+    # Stopping the listener drains the queue; the next write starts a new one
+    app.extensions['access_log'].stop()
+
+def test_requests_are_logged_with_timings(app, client):
+    with app.app_context():
+        user_id = make_user('alice').id
+    login(client, 'alice')
+    client.get('/meal-history')
+    _flush(app)
+
+    entries = [e for e in read_entries(app.config['ACCESS_LOG_PATH']) if e['path'] == '/meal-history']
+    entry = entries[-1]
+    assert entry['endpoint'] == 'main.meal_history'
+    assert entry['blueprint'] == 'main'
+    assert entry['user_id'] == str(user_id)
+    assert entry['status'] == 200
+    assert entry['db_statements'] > 0
+    for field in ('db_ms', 'render_ms', 'total_ms'):
+        assert entry[field] >= 0
+    assert entry['total_ms'] >= entry['db_ms']
+    assert entry['ts'].endswith('Z')
+
+def test_read_entries_starts_with_the_oldest_rotated_file(tmp_path):
+    path = str(tmp_path / 'access.log')
+    for suffix, ts in (('.2', '2024-01-01T00:00:00Z'), ('.1', '2024-01-02T00:00:00Z'),
+                       ('', '2024-01-03T00:00:00Z')):
+        with open(path + suffix, 'w') as f:
+            f.write(json.dumps({'ts': ts, 'endpoint': 'main.dashboard', 'total_ms': 1.0}) + '\n')
+            f.write('not json\n')
+    (tmp_path / 'access.log.3.gz').write_bytes(b'\x1f\x8b')
+
+    assert [e['ts'][:10] for e in read_entries(path)] == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert len(list(read_entries(path, since='2024-01-02T00:00:00Z'))) == 2
+
+def test_endpoint_percentiles():
+    entries = [{'endpoint': 'main.dashboard', 'total_ms': float(ms)} for ms in range(1, 101)]
+    entries.append({'endpoint': None, 'total_ms': 5.0})
+    stats = endpoint_percentiles(entries)
+    assert stats['main.dashboard'] == {'count': 100, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0}
+    assert stats['-']['count'] == 1
+
+def test_access_stats_command(app, client):
+    client.get('/login')
+    _flush(app)
+    result = app.test_cli_runner().invoke(args=['access-stats', '--blueprint', 'auth'])
+    assert result.exit_code == 0
+    assert 'auth.login' in result.output
+    assert 'main.' not in result.output
@@ -0,0 +1,78 @@
+import threading
+import time
+from utils.admission import PRIORITIES, AdmissionController, parse_classes
+
+CRITICAL, NORMAL, LOW = PRIORITIES['critical'], PRIORITIES['normal'], PRIORITIES['low']
+
+def _wait_for_queued(controller, count):
+    while controller.queued < count:
+        time.sleep(0.001)
+
+def test_parse_classes():
+    assert parse_classes('payment=critical, admin=low,') == {'payment': 'critical', 'admin': 'low'}
+    assert parse_classes('critical=10,low=0.5', float) == {'critical': 10.0, 'low': 0.5}
+
+def test_free_slots_admit_at_once():
+    controller = AdmissionController(concurrency=2, max_queue=4)
+    assert controller.acquire(NORMAL, 1) == (True, 0.0, None)
+    assert controller.acquire(NORMAL, 1) == (True, 0.0, None)
+    assert controller.active == 2
+
+def test_queued_requests_are_granted_by_priority():
+    controller = AdmissionController(concurrency=1, max_queue=4)
+    controller.acquire(NORMAL, 1)
+    results = []
+    threads = []
+    for name, priority in (('low', LOW), ('critical', CRITICAL)):
+        threads.append(threading.Thread(
+            target=lambda n=name, p=priority: results.append((n, controller.acquire(p, 5)))))
+        threads[-1].start()
+        _wait_for_queued(controller, len(threads))
+
+    controller.release()
+    threads[1].join(2)
+    assert [name for name, _ in results] == ['critical']
+    controller.release()
+    threads[0].join(2)
+    assert [name for name, _ in results] == ['critical', 'low']
+    assert all(admitted for _, (admitted, _, _) in results)
+
+def test_deadline_and_full_queue_are_shed():
+    controller = AdmissionController(concurrency=1, max_queue=1)
+    controller.acquire(NORMAL, 1)
+    admitted, waited, reason = controller.acquire(NORMAL, 0.01)
+    assert (admitted, reason) == (False, 'deadline')
+    assert waited >= 0.01
+    assert controller.queued == 0
+
+    controller.wait_average = 0.0
+    results = []
+    thread = threading.Thread(target=lambda: results.append(controller.acquire(NORMAL, 5)))
+    thread.start()
+    _wait_for_queued(controller, 1)
+    assert controller.acquire(NORMAL, 5) == (False, 0.0, 'queue_full')
+
+    # A more important request takes the queued one's place
+    critical = threading.Thread(target=lambda: results.append(controller.acquire(CRITICAL, 5)))
+    critical.start()
+    thread.join(2)
+    assert results[0][0] is False and results[0][2] == 'queue_full'
+    controller.release()
+    critical.join(2)
+    assert results[1][0] is True
+
+def test_slow_queue_is_shed_before_waiting():
+    controller = AdmissionController(concurrency=1, max_queue=4)
+    controller.acquire(NORMAL, 1)
+    controller.wait_average = 2.0
+    assert controller.acquire(LOW, 0.5) == (False, 0.0, 'slow_queue')
+
+def test_shed_requests_get_503_with_retry_after(app, client, monkeypatch):
+    controller = app.extensions['admission']
+    monkeypatch.setattr(controller, 'active', controller.concurrency)
+    monkeypatch.setattr(controller, 'max_queue', 0)
+    response = client.get('/login')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= app.config['ADMISSION_RETRY_AFTER']
+    # Exempt endpoints are always served
+    assert client.get('/metrics').status_code == 200
@@ -0,0 +1,65 @@
+from datetime import date, datetime
+import pytest
+from conftest import make_user, login
+from models import db, Meal, Payment, Subscription
+from utils.analytics import AnalyticsQueryError, parse_query, period_start
+
+def test_parse_query_defaults_and_normalizes():
+    query = parse_query({'end': '2026-06-30', 'dimensions': 'plan_type, meal_type,plan_type'}, 400)
+    assert query.start == date(2026, 6, 1)
+    assert query.granularity == 'day'
+    assert query.dimensions == ['meal_type', 'plan_type']
+    assert query.cache_key() == parse_query(
+        {'start': '2026-06-01', 'end': '2026-06-30', 'dimensions': 'meal_type,plan_type'}, 400).cache_key()
+
+@pytest.mark.parametrize('args', [
+    {'start': '2026-07-01', 'end': '2026-06-30'},
+    {'start': '2025-01-01', 'end': '2026-06-30'},
+    {'start': '30/06/2026'},
+    {'granularity': 'year'},
+    {'dimensions': 'colour'},
+])
+def test_parse_query_rejects(args):
+    with pytest.raises(AnalyticsQueryError):
+        parse_query(args, 400)
+
+def test_period_start():
+    day = date(2026, 6, 18)  # a Thursday
+    assert period_start(day, 'day') == day
+    assert period_start(day, 'week') == date(2026, 6, 15)
+    assert period_start(day, 'month') == date(2026, 6, 1)
+
+def test_api_answers_from_the_rollups(app, client):
+    with app.app_context():
+        student = make_user('student')
+        make_user('admin', role='admin')
+        weekly = Subscription(user_id=student.id, plan_type='weekly', start_date=datetime(2025, 9, 1),
+                              end_date=datetime(2026, 6, 30), status='active')
+        db.session.add(weekly)
+        db.session.flush()
+        for when, meal_type, subscription_id in ((datetime(2025, 9, 3, 12), 'lunch', weekly.id),
+                                                 (datetime(2025, 9, 20, 19), 'dinner', None),
+                                                 (datetime(2025, 10, 1, 8), 'breakfast', weekly.id)):
+            db.session.add(Meal(user_id=student.id, meal_type=meal_type, meal_date=when,
+                                status='confirmed', subscription_id=subscription_id))
+        db.session.add(Payment(user_id=student.id, amount=40, payment_type='subscription', status='completed',
+                               created_at=datetime(2025, 9, 1, 9), subscription_id=weekly.id))
+        db.session.commit()
+    login(client, 'admin')
+
+    response = client.get('/admin/api/analytics?start=2025-09-01&end=2026-06-30'
+                          '&granularity=month&dimensions=plan_type,payment_type')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['meals']['dimensions'] == ['plan_type']
+    assert data['meals']['series'] == [
+        {'period': '2025-09-01', 'plan_type': 'one-time', 'meals': 1},
+        {'period': '2025-09-01', 'plan_type': 'weekly', 'meals': 1},
+        {'period': '2025-10-01', 'plan_type': 'weekly', 'meals': 1},
+    ]
+    assert data['revenue']['series'] == [
+        {'period': '2025-09-01', 'payment_type': 'subscription', 'plan_type': 'weekly',
+         'payments': 1, 'amount': 40},
+    ]
+
+    assert client.get('/admin/api/analytics?granularity=year').status_code == 400
@@ -0,0 +1,44 @@
+import os
+from flask import Flask, url_for
+from utils.assets import build_manifest, fingerprinted_name
+from utils.conditional import deploy_fingerprint
+
+def make_site(root, template='<p>hi</p>', css='body {}'):
+    os.makedirs(root / 'templates', exist_ok=True)
+    os.makedirs(root / 'static', exist_ok=True)
+    (root / 'templates' / 'page.html').write_text(template)
+    (root / 'static' / 'site.css').write_text(css)
+    return Flask('site', root_path=str(root))
+
+def test_static_urls_carry_a_content_hash_and_are_immutable(app, client):
+    with app.test_request_context():
+        url = url_for('static', filename='css/apple.css')
+    assert url != '/static/css/apple.css'
+    assert url == '/static/' + app.extensions['asset_manifest']['css/apple.css']
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+
+def test_manifest_names_follow_content(tmp_path):
+    make_site(tmp_path)
+    first = build_manifest(str(tmp_path / 'static'))
+    (tmp_path / 'static' / 'site.css').write_text('body { color: red }')
+    second = build_manifest(str(tmp_path / 'static'))
+    assert first['site.css'] != second['site.css']
+    assert fingerprinted_name('a/b.css', 'abcdef0123456789').startswith('a/b.abcdef012345')
+
+def test_deploy_fingerprint_depends_on_content_not_mtime(tmp_path):
+    site = make_site(tmp_path / 'one')
+    other_checkout = make_site(tmp_path / 'two')
+    fingerprint = deploy_fingerprint(site)
+    assert deploy_fingerprint(other_checkout) == fingerprint
+
+    os.utime(tmp_path / 'one' / 'templates' / 'page.html', (1, 1))
+    assert deploy_fingerprint(site) == fingerprint
+
+    (tmp_path / 'one' / 'templates' / 'page.html').write_text('<p>changed</p>')
+    assert deploy_fingerprint(site) != fingerprint
+    (tmp_path / 'one' / 'templates' / 'page.html').write_text('<p>hi</p>')
+    (tmp_path / 'one' / 'static' / 'site.css').write_text('body { margin: 0 }')
+    assert deploy_fingerprint(site) != fingerprint
@@ -0,0 +1,74 @@
+import time
+import pytest
+from sqlalchemy import event
+from models import db, MealPlan
+from utils import cache_backends
+from utils.cache_backends import SQLiteCache, cache_type
+from utils.catalog import PlanView, active_meal_plans
+
+@pytest.fixture
+def statements(app_context):
+    seen = []
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+def _plan(name, is_active=True):
+    plan = MealPlan(name=name, price=100.0, duration=30, meals_included=60, is_active=is_active)
+    db.session.add(plan)
+    db.session.commit()
+    return plan
+
+def test_active_plans_are_cached_until_a_plan_changes(statements):
+    _plan('Monthly')
+    _plan('Retired', is_active=False)
+
+    plans = active_meal_plans()
+    assert [plan.name for plan in plans] == ['Monthly']
+    assert isinstance(plans[0], PlanView)
+    with pytest.raises(AttributeError):
+        plans[0].price = 0
+
+    del statements[:]
+    assert active_meal_plans() == plans
+    assert not any('meal_plans' in statement for statement in statements)
+
+    _plan('Weekly')
+    assert [plan.name for plan in active_meal_plans()] == ['Monthly', 'Weekly']
+
+def test_rolled_back_changes_keep_the_cache(statements):
+    _plan('Monthly')
+    active_meal_plans()
+    db.session.add(MealPlan(name='Draft', price=1.0, duration=1, meals_included=1))
+    db.session.flush()
+    db.session.rollback()
+
+    del statements[:]
+    assert [plan.name for plan in active_meal_plans()] == ['Monthly']
+    assert not any('meal_plans' in statement for statement in statements)
+
+def test_cache_type():
+    assert cache_type('simple') == 'SimpleCache'
+    assert cache_type('shared') == 'utils.cache_backends.SQLiteCache'
+    assert cache_type('RedisCache') == 'RedisCache'
+
+def test_sqlite_cache(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), default_timeout=60)
+    assert cache.get('missing') is None
+    assert cache.set('plans', ('a', 1))
+    assert cache.get('plans') == ('a', 1)
+    assert not cache.add('plans', 'other')
+    assert cache.has('plans')
+
+    # Entries are shared with every other connection to the file
+    assert SQLiteCache(str(tmp_path / 'cache.db')).get('plans') == ('a', 1)
+
+    later = time.time() + 61
+    monkeypatch.setattr(cache_backends, 'time', type('Clock', (), {'time': staticmethod(lambda: later)}))
+    assert cache.get('plans') is None
+    assert cache.add('plans', 'fresh')
+    assert cache.get('plans') == 'fresh'
+    assert cache.delete('plans')
+    assert not cache.has('plans')
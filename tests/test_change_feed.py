@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from models import db, User, Meal
+from utils.change_feed import CursorError, changes_page, decode_cursor, encode_cursor
+from conftest import make_user
+
+def add_meals(user_id, count):
+    meals = [Meal(user_id=user_id, meal_type='lunch', meal_date=datetime.utcnow() + timedelta(days=i))
+             for i in range(count)]
+    db.session.add_all(meals)
+    db.session.commit()
+    return meals
+
+def read_all(data_type, cursor=None, limit=2):
+    ids = []
+    while True:
+        rows, cursor, has_more = changes_page(data_type, cursor, limit)
+        ids += [row['id'] for row in rows]
+        if not has_more:
+            return ids, cursor
+
+def test_cursor_round_trip(app_context):
+    cursor = encode_cursor('meals', 7, 42)
+    assert decode_cursor('meals', cursor) == (7, 42)
+    with pytest.raises(CursorError):
+        decode_cursor('users', cursor)
+    with pytest.raises(CursorError):
+        decode_cursor('meals', cursor[:-2] + 'xx')
+
+def test_pages_cover_every_row_once_and_resume_from_the_cursor(app_context):
+    student = make_user('student')
+    meals = add_meals(student.id, 5)
+    ids, cursor = read_all('meals')
+    assert ids == [meal.id for meal in meals]
+
+    rows, same_cursor, has_more = changes_page('meals', cursor)
+    assert rows == [] and same_cursor == cursor and not has_more
+
+    meals[1].status = 'cancelled'
+    db.session.commit()
+    rows, cursor, _ = changes_page('meals', cursor)
+    assert [(row['id'], row['status']) for row in rows] == [(meals[1].id, 'cancelled')]
+
+def test_login_does_not_enter_the_feed(app_context):
+    student = make_user('student')
+    _, cursor = read_all('users')
+    db.session.get(User, student.id).last_login = datetime.utcnow()
+    db.session.commit()
+    assert changes_page('users', cursor)[0] == []
+
+def test_rows_are_numbered_when_their_transaction_commits(app_context):
+    student = make_user('student')
+    add_meals(student.id, 2)
+    # Flushed but not committed: no number yet, so not in the feed
+    late = Meal(user_id=student.id, meal_type='dinner', meal_date=datetime.utcnow())
+    db.session.add(late)
+    db.session.flush()
+    assert late.change_seq is None
+    with db.engine.connect() as conn:
+        assert late.id not in conn.execute(select(Meal.id).where(Meal.change_seq.isnot(None))).scalars().all()
+
+    # A reader takes its cursor while the transaction is still open...
+    with db.engine.connect() as conn:
+        last = conn.execute(select(Meal.change_seq, Meal.id).where(Meal.change_seq.isnot(None))
+                            .order_by(Meal.change_seq.desc(), Meal.id.desc())).first()
+    cursor = encode_cursor('meals', *last)
+    db.session.commit()
+
+    # ...and still gets the row, numbered after everything it had seen
+    rows, _, _ = changes_page('meals', cursor)
+    assert [row['id'] for row in rows] == [late.id]
+    assert rows[0]['change_seq'] > last[0]
+
+def test_rows_without_a_number_are_left_out(app_context):
+    student = make_user('student')
+    meals = add_meals(student.id, 2)
+    db.session.execute(Meal.__table__.update().where(Meal.id == meals[0].id).values(change_seq=None))
+    db.session.commit()
+    assert read_all('meals')[0] == [meals[1].id]
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, User, Meal
+from utils.versioning import get_version, user_scope
+from conftest import login, make_user
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        return {name: make_user(name, role).id
+                for name, role in (('student', 'student'), ('other', 'student'), ('admin', 'admin'))}
+
+def add_meal(app, user_id, days=1):
+    with app.app_context():
+        db.session.add(Meal(user_id=user_id, meal_type='lunch', meal_date=datetime.utcnow() + timedelta(days=days)))
+        db.session.commit()
+
+def test_dashboard_answers_304_until_the_users_data_changes(app, client, users):
+    login(client, 'student')
+    first = client.get('/dashboard')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    cached = client.get('/dashboard', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    # Someone else's meal leaves this student's ETag alone
+    add_meal(app, users['other'])
+    assert client.get('/dashboard', headers={'If-None-Match': etag}).status_code == 304
+
+    add_meal(app, users['student'])
+    changed = client.get('/dashboard', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_meal_history_etag_differs_per_user(app, users):
+    first = login(app.test_client(), 'student').get('/meal-history').headers['ETag']
+    second = login(app.test_client(), 'other').get('/meal-history').headers['ETag']
+    assert first != second
+
+def test_export_etag_follows_the_exported_table(app, client, users):
+    login(client, 'admin')
+    first = client.get('/admin/export-data?type=meals')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get('/admin/export-data?type=meals', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/admin/export-data?type=users', headers={'If-None-Match': etag}).status_code == 200
+
+    add_meal(app, users['student'])
+    assert client.get('/admin/export-data?type=meals', headers={'If-None-Match': etag}).status_code == 200
+
+def test_writes_bump_table_and_user_versions(app_context):
+    student = make_user('student')
+    meals, owner = get_version('meals'), get_version(user_scope(student.id))
+    meal = Meal(user_id=student.id, meal_type='dinner', meal_date=datetime.utcnow())
+    db.session.add(meal)
+    db.session.commit()
+    assert get_version('meals') == meals + 1
+    assert get_version(user_scope(student.id)) == owner + 1
+
+    meal.status = 'cancelled'
+    db.session.commit()
+    assert get_version('meals') == meals + 2
+
+def test_login_alone_does_not_bump_the_users_version(app_context):
+    student = make_user('student')
+    before = get_version('users')
+    db.session.get(User, student.id).last_login = datetime.utcnow()
+    db.session.commit()
+    assert get_version('users') == before
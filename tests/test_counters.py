@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db, AdminCounter, Meal, Subscription
+from utils.counters import apply_deltas, dashboard_counters, meals_on, read_counters, reconcile_counters
+from conftest import make_user
+
+def stored():
+    return {row.name: row.value for row in AdminCounter.query}
+
+def test_counters_follow_inserts_updates_and_deletes(app_context):
+    reconcile_counters()  # seeds the fixed counters
+    student = make_user('student')
+    today = datetime.utcnow().replace(hour=12)
+    meal = Meal(user_id=student.id, meal_type='lunch', meal_date=today)
+    subscription = Subscription(user_id=student.id, plan_type='weekly', start_date=today,
+                                end_date=today + timedelta(days=7), status='active')
+    db.session.add_all([meal, subscription])
+    db.session.commit()
+    assert stored()['users'] == 1
+    assert stored()['active_subscriptions'] == 1
+    assert stored()[meals_on(today.date())] == 1
+
+    # Both attributes are expired after the commit; the old values still
+    # have to come out of the right counters
+    meal.meal_date = today + timedelta(days=1)
+    subscription.status = 'cancelled'
+    db.session.commit()
+    assert stored()[meals_on(today.date())] == 0
+    assert stored()[meals_on((today + timedelta(days=1)).date())] == 1
+    assert stored()['active_subscriptions'] == 0
+
+    db.session.delete(meal)
+    db.session.commit()
+    assert stored()[meals_on((today + timedelta(days=1)).date())] == 0
+
+def test_rolled_back_changes_leave_counters_alone(app_context):
+    reconcile_counters()
+    student = make_user('student')
+    before = stored()
+    db.session.add(Meal(user_id=student.id, meal_type='lunch', meal_date=datetime.utcnow()))
+    db.session.flush()
+    db.session.rollback()
+    assert stored() == before
+
+def test_missing_counters_are_reconciled_on_read(app_context):
+    # A database that had rows before admin_counters existed
+    student = make_user('student')
+    db.session.add(Meal(user_id=student.id, meal_type='lunch', meal_date=datetime.utcnow()))
+    db.session.add(Meal(user_id=student.id, meal_type='dinner', meal_date=datetime.utcnow()))
+    db.session.commit()
+    db.session.execute(AdminCounter.__table__.delete())
+    db.session.commit()
+
+    counters = dashboard_counters()
+    assert counters['total_users'] == 1
+    assert counters['total_meals_today'] == 2
+    assert read_counters(['users'])['users'] == 1
+    assert reconcile_counters() == {}
+
+def test_counter_rows_are_upserted_in_one_statement(app_context):
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with db.engine.begin() as conn:
+            apply_deltas(conn, {'meals_on:2030-01-01': 2})
+            apply_deltas(conn, {'meals_on:2030-01-01': 3})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert stored()['meals_on:2030-01-01'] == 5
+    assert len(statements) == 2
+    assert all('ON CONFLICT' in statement for statement in statements)
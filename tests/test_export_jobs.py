@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime, timedelta
+from models import db, ExportJob
+from utils import export_jobs
+
+def _queued(created_at, key=None):
+    job = ExportJob(id=uuid.uuid4().hex, active_key=key or uuid.uuid4().hex, data_type='meals', format='csv',
+                    status='queued', created_at=created_at)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+def test_prune_fails_jobs_queued_past_the_timeout(app_context):
+    now = datetime.utcnow()
+    abandoned = _queued(now - timedelta(hours=2), key='abandoned')
+    fresh = _queued(now - timedelta(minutes=1))
+
+    export_jobs.prune_exports()
+    db.session.expire_all()
+    job = db.session.get(ExportJob, abandoned)
+    assert (job.status, job.error, job.active_key) == ('failed', 'Never started', None)
+    assert db.session.get(ExportJob, fresh).status == 'queued'
+    # The key is free again, so the same export can be queued
+    _queued(now, key='abandoned')
+
+def test_jobs_left_queued_are_requeued_on_the_first_request(app, client, monkeypatch):
+    runner = app.extensions['export_jobs']
+    started = []
+    monkeypatch.setattr(runner, 'start', lambda job_id, download_url=None: started.append((job_id, download_url)))
+    monkeypatch.setattr(runner, 'resumed_pid', None)
+    with app.app_context():
+        left_behind = _queued(runner.started_at - timedelta(minutes=5))
+        _queued(runner.started_at + timedelta(seconds=1))  # this process's own, already submitted
+
+    client.get('/login')
+    client.get('/login')
+    assert started == [(left_behind, f'http://localhost/admin/export-jobs/{left_behind}/download')]
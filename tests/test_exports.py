@@ -0,0 +1,101 @@
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import datetime
+import pytest
+from conftest import make_user, login
+from models import db, Meal
+from utils import exports
+
+def _admin_with_meals(app, client, count=5):
+    with app.app_context():
+        student = make_user('student')
+        make_user('admin', role='admin')
+        for day in range(count):
+            db.session.add(Meal(user_id=student.id, meal_type='lunch', meal_date=datetime(2026, 3, 1 + day, 12),
+                                status='confirmed'))
+        db.session.commit()
+    login(client, 'admin')
+
+def test_json_ndjson_and_csv(app, client):
+    _admin_with_meals(app, client)
+    meals = client.get('/admin/export-data?type=meals').get_json()
+    assert [meal['meal_date'] for meal in meals][:2] == ['2026-03-01T12:00:00', '2026-03-02T12:00:00']
+    assert set(meals[0]) == set(exports.EXPORTS['meals'][1])
+
+    lines = client.get('/admin/export-data?type=meals&format=ndjson').data.decode().splitlines()
+    assert [json.loads(line) for line in lines] == meals
+
+    response = client.get('/admin/export-data?type=meals&format=csv')
+    assert response.headers['Content-Disposition'] == 'attachment; filename=meals.csv'
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert len(rows) == 5 and rows[0]['status'] == 'confirmed'
+
+def test_gzip_and_date_range(app, client):
+    _admin_with_meals(app, client)
+    response = client.get('/admin/export-data?type=meals&format=ndjson&gzip=1&start=2026-03-02&end=2026-03-03')
+    assert response.mimetype == 'application/gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line)['meal_date'][:10] for line in lines] == ['2026-03-02', '2026-03-03']
+
+def test_rejects_unknown_types_and_bad_dates(app, client):
+    _admin_with_meals(app, client, count=0)
+    assert client.get('/admin/export-data?type=passwords').status_code == 400
+    assert client.get('/admin/export-data?type=meals&format=xml').status_code == 400
+    assert client.get('/admin/export-data?type=meals&start=March').status_code == 400
+
+def test_stream_is_chunked(app_context, monkeypatch):
+    monkeypatch.setattr(exports, 'CHUNK_BYTES', 10)
+    student = make_user('student')
+    for day in range(3):
+        db.session.add(Meal(user_id=student.id, meal_type='dinner', meal_date=datetime(2026, 3, 1 + day)))
+    db.session.commit()
+    chunks = list(exports.export_stream('meals', 'ndjson'))
+    # The first row goes out on its own, then a chunk per CHUNK_BYTES
+    assert len(chunks) == 3
+    assert b''.join(chunks).count(b'\n') == 3
+
+def _meals_over_months(count):
+    student = make_user('student')
+    for i in range(count):
+        db.session.add(Meal(user_id=student.id, meal_type=('breakfast', 'lunch', 'dinner')[i % 3],
+                            meal_date=datetime(2026, 1 + i % 3, 1 + i % 28, 12), status=('pending', 'confirmed')[i % 2]))
+    db.session.commit()
+
+def test_arrow_file_with_several_record_batches(app_context, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    monkeypatch.setattr(exports, 'ROW_GROUP_SIZE', 10)
+    _meals_over_months(25)
+    data = b''.join(exports.export_stream('meals', 'arrow'))
+
+    reader = pa.ipc.open_file(pa.BufferReader(data))
+    assert reader.num_record_batches == 3
+    table = reader.read_all()
+    assert table.num_rows == 25
+    assert pa.types.is_dictionary(table.schema.field('meal_type').type)
+    assert table.column('meal_type').to_pylist()[:4] == ['breakfast', 'lunch', 'dinner', 'breakfast']
+
+    # Partitioned: a record batch per month, however small
+    data = b''.join(exports.export_stream('meals', 'arrow', partition='month'))
+    reader = pa.ipc.open_file(pa.BufferReader(data))
+    assert reader.num_record_batches == 3
+    assert reader.read_all().num_rows == 25
+
+def test_parquet_row_groups_follow_the_partition(app_context):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    _meals_over_months(25)
+    data = b''.join(exports.export_stream('meals', 'parquet', partition='month'))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.num_row_groups == 3
+    months = [{d.month for d in parquet.read_row_group(i).column('meal_date').to_pylist()}
+              for i in range(parquet.num_row_groups)]
+    assert months == [{1}, {2}, {3}]
+
+def test_columnar_available_is_checked_once(monkeypatch):
+    monkeypatch.setattr(exports, '_columnar_available', None)
+    available = exports.columnar_available()
+    monkeypatch.setitem(sys.modules, 'pyarrow.parquet', None)
+    assert exports.columnar_available() is available
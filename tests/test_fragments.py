@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from conftest import make_user, login
+from models import db, Meal
+
+SECTION_TABLES = ('meals', 'subscriptions', 'payments')
+
+@pytest.fixture
+def statements(app):
+    seen = []
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(engine, 'before_cursor_execute', record)
+
+def _section_queries(statements):
+    return [s for s in statements if any(f'FROM {table}' in s for table in SECTION_TABLES)]
+
+def _book(app, username, meal_type):
+    with app.app_context():
+        user_id = db.session.execute(db.text('SELECT id FROM users WHERE username = :u'), {'u': username}).scalar()
+        db.session.add(Meal(user_id=user_id, meal_type=meal_type, meal_date=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+
+def test_warm_dashboard_runs_no_section_queries(app, client, statements):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    assert b'No upcoming meals scheduled' in client.get('/dashboard').data
+    assert _section_queries(statements)
+
+    del statements[:]
+    assert b'No upcoming meals scheduled' in client.get('/dashboard').data
+    assert _section_queries(statements) == []
+
+def test_fragments_follow_the_users_data(app, client):
+    with app.app_context():
+        make_user('alice')
+        make_user('bob')
+    login(client, 'alice')
+    client.get('/dashboard')
+
+    _book(app, 'alice', 'breakfast')
+    assert b'Breakfast' in client.get('/dashboard').data
+
+    # Bob's sections are his own, and his bookings don't touch Alice's
+    bob = app.test_client()
+    login(bob, 'bob')
+    assert b'Breakfast' not in bob.get('/dashboard').data
+    _book(app, 'bob', 'dinner')
+    assert b'Dinner' in bob.get('/dashboard').data
+    assert b'Dinner' not in client.get('/dashboard').data
@@ -0,0 +1,87 @@
+import os
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+from utils import limiter_storage
+from utils.limiter_storage import SQLiteStorage
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(limiter_storage, 'time', clock)
+    return clock
+
+@pytest.fixture
+def storage(tmp_path):
+    return storage_from_string('sqlite:///' + os.path.join(tmp_path, 'limits.db'))
+
+def test_sqlite_uri_selects_the_sqlite_storage(storage):
+    assert isinstance(storage, SQLiteStorage)
+    assert storage.check()
+
+def test_moving_window_allows_limit_hits_then_slides(storage, clock):
+    limiter = MovingWindowRateLimiter(storage)
+    limit = parse('3 per minute')
+    for _ in range(3):
+        assert limiter.hit(limit, 'login', 'alice')
+        clock.now += 10
+    assert not limiter.hit(limit, 'login', 'alice')
+    assert limiter.hit(limit, 'login', 'bob')
+
+    # The first hit leaves the window 60s after it was made
+    clock.now += 31
+    assert limiter.hit(limit, 'login', 'alice')
+    assert not limiter.hit(limit, 'login', 'alice')
+
+def test_moving_window_counts_cost(storage, clock):
+    limiter = MovingWindowRateLimiter(storage)
+    limit = parse('5 per minute')
+    assert limiter.hit(limit, 'export', cost=3)
+    assert not limiter.hit(limit, 'export', cost=3)
+    assert limiter.hit(limit, 'export', cost=2)
+    assert not limiter.hit(limit, 'export', cost=6)
+
+def test_window_stats_and_clear(storage, clock):
+    limiter = MovingWindowRateLimiter(storage)
+    limit = parse('4 per minute')
+    limiter.hit(limit, 'stats')
+    clock.now += 5
+    limiter.hit(limit, 'stats')
+    reset_at, remaining = limiter.get_window_stats(limit, 'stats')
+    assert remaining == 2
+    assert reset_at == pytest.approx(1_000_000.0 + 60)
+
+    limiter.clear(limit, 'stats')
+    assert limiter.get_window_stats(limit, 'stats')[1] == 4
+
+def test_entries_are_shared_between_storage_instances(tmp_path, clock):
+    uri = 'sqlite:///' + os.path.join(tmp_path, 'shared.db')
+    limit = parse('2 per minute')
+    first = MovingWindowRateLimiter(storage_from_string(uri))
+    second = MovingWindowRateLimiter(storage_from_string(uri))
+    assert first.hit(limit, 'shared')
+    assert second.hit(limit, 'shared')
+    assert not first.hit(limit, 'shared')
+
+def test_sweep_removes_expired_rows_of_other_keys(storage, clock, monkeypatch):
+    limiter = MovingWindowRateLimiter(storage)
+    limiter.hit(parse('3 per minute'), 'login', 'once')
+    limiter.hit(parse('3 per hour'), 'login', 'long')
+    storage.incr('fixed/once', 60)
+    clock.now += 120
+
+    monkeypatch.setattr(limiter_storage, 'SWEEP_EVERY', 1)
+    assert limiter.hit(parse('3 per minute'), 'login', 'other')
+    conn = storage._connection()
+    keys = {row[0] for row in conn.execute('SELECT key FROM window_entries')}
+    assert not any('once' in key for key in keys)
+    assert any('long' in key for key in keys)
+    assert conn.execute('SELECT COUNT(*) FROM counters').fetchone()[0] == 0
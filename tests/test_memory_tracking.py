@@ -0,0 +1,53 @@
+import json
+import time
+import tracemalloc
+from utils.memory_tracking import MIN_SAMPLES, PeakWatcher, endpoint_memory, top_sites
+
+def _entry(endpoint, peak_kb, users):
+    return {'ts': '2030-01-01T00:00:00Z', 'endpoint': endpoint, 'total_ms': 1.0,
+            'peak_alloc_kb': peak_kb, 'table_rows': {'users': users, 'meals': 1000}}
+
+def _samples():
+    # The export's peak follows the users table, the dashboard's doesn't
+    entries = [_entry('admin.export_data', 100 + users * 2, users) for users in range(10, 10 + MIN_SAMPLES)]
+    entries += [_entry('main.dashboard', 40 + i % 3, 10 + i) for i in range(MIN_SAMPLES)]
+    entries.append({'ts': '2030-01-01T00:00:00Z', 'endpoint': 'auth.login', 'total_ms': 1.0})
+    return entries
+
+def test_endpoint_memory_flags_growth_with_table_size():
+    report = endpoint_memory(_samples())
+    export = report['admin.export_data']
+    assert export['count'] == MIN_SAMPLES
+    assert export['grows_with']['table'] == 'users'
+    assert export['grows_with']['bytes_per_row'] == 2048
+    assert report['main.dashboard']['grows_with'] is None
+    assert 'auth.login' not in report
+
+def test_peak_watcher_and_top_sites():
+    tracemalloc.start(4)
+    try:
+        baseline = tracemalloc.take_snapshot()
+        watcher = PeakWatcher(0.001, baseline)
+        watcher.start()
+        blocks = [bytearray(1024) for _ in range(2000)]
+        # The watcher only snapshots again after 25% growth
+        allocated = tracemalloc.get_traced_memory()[0]
+        deadline = time.monotonic() + 5
+        while watcher.snapshot_size * 1.25 < allocated and time.monotonic() < deadline:
+            time.sleep(0.001)
+        snapshot = watcher.stop()
+        sites = top_sites(snapshot, baseline, 5)
+    finally:
+        tracemalloc.stop()
+    del blocks
+    assert sites[0]['size_kb'] >= 1000
+    assert any(filename == __file__ for filename, _ in sites[0]['traceback'])
+
+def test_memory_stats_command(app, tmp_path, monkeypatch):
+    path = tmp_path / 'access.log'
+    path.write_text(''.join(json.dumps(entry) + '\n' for entry in _samples()))
+    monkeypatch.setitem(app.config, 'ACCESS_LOG_PATH', str(path))
+    result = app.test_cli_runner().invoke(args=['memory-stats', '--minutes', str(10 ** 8)])
+    assert result.exit_code == 0
+    export_line = next(line for line in result.output.splitlines() if line.startswith('admin.export_data'))
+    assert 'users (r=1.00, 2048 B/row)' in export_line
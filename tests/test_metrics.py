@@ -0,0 +1,33 @@
+from prometheus_client import REGISTRY
+from models import db
+from utils.metrics import _timed_pool_classes
+
+def _sample(name):
+    return REGISTRY.get_sample_value(name) or 0
+
+def test_metrics_are_served_to_localhost_only(app, client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'messmate_requests_total' in response.data
+    assert client.get('/metrics', headers={'X-Forwarded-For': '10.0.0.1'}).status_code == 401
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 401
+
+def test_metrics_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+def test_pool_checkout_wait_is_observed(app, client):
+    before = _sample('messmate_db_pool_checkout_wait_seconds_count')
+    client.get('/login')
+    with app.app_context():
+        db.session.execute(db.select(1))
+        db.session.remove()
+    assert _sample('messmate_db_pool_checkout_wait_seconds_count') > before
+    assert _sample('messmate_db_pool_connections_in_use') == 0
+
+def test_checkout_timing_survives_dispose(app):
+    with app.app_context():
+        db.engine.dispose()
+        assert type(db.engine.pool) in _timed_pool_classes.values()
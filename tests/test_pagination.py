@@ -0,0 +1,57 @@
+import pytest
+from models import db, User
+from utils.pagination import paginate
+from conftest import make_user
+
+@pytest.fixture
+def twelve_users(app, app_context):
+    limit = app.config['PAGINATION_EXACT_LIMIT']
+    app.config['PAGINATION_EXACT_LIMIT'] = 5
+    for i in range(12):
+        make_user(f'user{i:02}')
+    yield
+    app.config['PAGINATION_EXACT_LIMIT'] = limit
+
+def page_of(page, exact=False, count_key='all'):
+    return paginate(User.query.order_by(User.id), page=page, per_page=5, scope='users',
+                    count_key=count_key, exact=exact)
+
+def test_counts_stop_at_the_limit_and_are_marked_estimated(twelve_users):
+    first = page_of(1)
+    assert len(first.items) == 5
+    assert first.estimated
+    assert first.total == 6  # the bound, one past PAGINATION_EXACT_LIMIT
+    assert first.has_next
+
+def test_exact_count_on_request(twelve_users):
+    first = page_of(1, exact=True)
+    assert not first.estimated
+    assert first.total == 12
+
+def test_an_estimate_never_ends_before_the_page_shown(twelve_users):
+    third = page_of(3)
+    assert [user.username for user in third.items] == ['user10', 'user11']
+    assert third.total >= 12
+    assert not third.has_next
+
+def test_small_results_are_counted_exactly(app, app_context):
+    for i in range(3):
+        make_user(f'user{i}')
+    page = page_of(1)
+    assert page.total == 3
+    assert not page.estimated
+    assert not page.has_next
+
+def test_cached_total_is_dropped_when_the_table_changes(app, app_context):
+    for i in range(3):
+        make_user(f'user{i}')
+    assert page_of(1).total == 3
+    # Manual SQL doesn't bump the version, so the cached total is still used
+    db.session.execute(User.__table__.delete().where(User.username == 'user0'))
+    db.session.commit()
+    assert page_of(1).total == 3
+    assert page_of(1, count_key='other').total == 2
+    # An ORM write does, and the next page view counts again
+    make_user('user3')
+    make_user('user4')
+    assert page_of(1).total == 4
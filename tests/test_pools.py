@@ -0,0 +1,40 @@
+from flask import Blueprint, Flask, request
+from utils import pools
+
+def _app(worker_pool):
+    app = Flask(__name__)
+    app.config['WORKER_POOL'] = worker_pool
+    admin = Blueprint('admin', __name__)
+    main = Blueprint('main', __name__)
+    admin.add_url_rule('/admin/export', 'export', lambda: 'export')
+    main.add_url_rule('/dashboard', 'dashboard', lambda: request.remote_addr)
+    app.register_blueprint(admin)
+    app.register_blueprint(main)
+    app.add_url_rule('/metrics', 'metrics', lambda: 'metrics')
+    pools.init_app(app)
+    return app
+
+def test_parse_pools():
+    assert pools.parse_pools('admin=admin+reports, kitchen=kitchen') == {
+        'admin': 'admin', 'reports': 'admin', 'kitchen': 'kitchen'}
+    assert pools.pool_for('main', {'admin': 'admin'}) == pools.DEFAULT_POOL
+
+def test_each_pool_only_serves_its_blueprints():
+    student = _app('student').test_client()
+    admin = _app('admin').test_client()
+    assert student.get('/dashboard').status_code == 200
+    assert student.get('/admin/export').status_code == 421
+    assert admin.get('/admin/export').status_code == 200
+    assert admin.get('/dashboard').status_code == 421
+    assert student.get('/metrics').status_code == 200
+    assert admin.get('/metrics').status_code == 200
+
+def test_pooled_processes_trust_the_proxy():
+    client = _app('student').test_client()
+    response = client.get('/dashboard', headers={'X-Forwarded-For': '10.1.2.3'})
+    assert response.text == '10.1.2.3'
+
+def test_unpooled_app_serves_everything_and_ignores_forwarded_for():
+    client = _app('').test_client()
+    assert client.get('/admin/export').status_code == 200
+    assert client.get('/dashboard', headers={'X-Forwarded-For': '10.1.2.3'}).text == '127.0.0.1'
@@ -0,0 +1,48 @@
+import time
+from conftest import make_user, login
+from utils.profiler import Sampler, collapsed_stacks, speedscope
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_sampler_records_the_target_threads_stack():
+    import threading
+    sampler = Sampler(threading.get_ident(), 0.001)
+    sampler.start()
+    _busy(0.05)
+    samples = sampler.stop()
+    assert sum(samples.values()) > 0
+    assert any(frame[0] == '_busy' for stack in samples for frame in stack)
+
+def test_profile_formats():
+    profile = {
+        'method': 'GET', 'path': '/dashboard?', 'endpoint': 'main.dashboard', 'interval': 0.005,
+        'stacks': [[[['root', '/app/app.py', 1], ['leaf', '/app/utils/x.py', 10]], 3],
+                   [[['root', '/app/app.py', 1]], 1]],
+    }
+    assert collapsed_stacks(profile) == 'root (app.py:1);leaf (x.py:10) 3\nroot (app.py:1) 1\n'
+    document = speedscope(profile)
+    assert [frame['name'] for frame in document['shared']['frames']] == ['root', 'leaf']
+    assert document['profiles'][0]['samples'] == [[0, 1], [0]]
+    assert document['profiles'][0]['weights'] == [0.015, 0.005]
+
+def test_only_admins_can_profile_a_request(app, client):
+    with app.app_context():
+        make_user('admin', role='admin')
+        make_user('student')
+    login(client, 'student')
+    assert 'X-Profile-Id' not in client.get('/dashboard?_profile=1').headers
+    client.get('/logout')
+
+    login(client, 'admin')
+    assert 'X-Profile-Id' not in client.get('/admin/api/changes?type=users').headers
+    response = client.get('/admin/api/changes?type=users', headers={'X-Profile': '1'})
+    profile_id = response.headers['X-Profile-Id']
+
+    download = client.get(f'/admin/profiles/{profile_id}/speedscope')
+    assert download.status_code == 200
+    assert download.get_json()['name'].startswith('GET /admin/api/changes?type=users')
+    assert client.get(f'/admin/profiles/{profile_id}/collapsed').status_code == 200
+    assert profile_id.encode() in client.get('/admin/profiles').data
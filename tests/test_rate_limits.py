@@ -0,0 +1,29 @@
+from conftest import make_user, login
+from utils.rate_limits import parse_costs
+
+def test_parse_costs():
+    assert parse_costs('auth.login:POST=2, admin.export_data=5,') == {
+        'auth.login:POST': 2, 'admin.export_data': 5}
+    assert parse_costs('') == {}
+
+def test_login_attempts_are_charged_against_the_shared_budget(client):
+    # 50 per hour shared by everyone on the address; each attempt costs 2.
+    # A different username each time keeps clear of the login limit itself.
+    for attempt in range(24):
+        response = client.post('/login', data={'username': f'guess{attempt}', 'password': 'x'})
+        assert response.status_code != 429
+    assert client.get('/login').status_code == 200
+    assert client.get('/login').status_code == 200
+    assert client.get('/login').status_code == 429
+
+def test_budget_is_per_account_once_logged_in(app, client):
+    with app.app_context():
+        make_user('alice')
+        make_user('bob')
+    alice, bob = client, app.test_client()
+    login(alice, 'alice')
+    login(bob, 'bob')
+    for _ in range(50):
+        assert alice.get('/login').status_code == 302
+    assert alice.get('/login').status_code == 429
+    assert bob.get('/login').status_code == 302
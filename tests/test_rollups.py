@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import db, Meal, Payment, MealRollup, RevenueRollup, RollupChange, RollupState
+from utils.rollups import STATE_NAME, rebuild_rollups, refresh_rollups
+from conftest import make_user
+
+NOON = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+
+def rollup_rows():
+    meals = sorted((row.day, row.meal_type, row.status, row.plan_type, row.meals) for row in MealRollup.query)
+    revenue = sorted((row.day, row.payment_type, row.status, row.payments, row.amount) for row in RevenueRollup.query)
+    return meals, revenue
+
+def add_data(user_id):
+    for days in range(3):
+        db.session.add(Meal(user_id=user_id, meal_type='lunch', meal_date=NOON - timedelta(days=days), status='confirmed'))
+    db.session.add(Payment(user_id=user_id, amount=40, payment_type='one-time', status='completed', created_at=NOON))
+    db.session.commit()
+
+def test_refresh_only_applies_the_log_and_rebuild_bootstraps(app_context):
+    student = make_user('student')
+    add_data(student.id)
+    # As on a database that had meals and payments before the rollups existed
+    for model in (RollupChange, RollupState, MealRollup, RevenueRollup):
+        db.session.execute(model.__table__.delete())
+    db.session.commit()
+
+    # The analytics page's refresh never scans the tables
+    assert refresh_rollups() == 0
+    assert MealRollup.query.count() == 0
+
+    rebuild_rollups()
+    assert db.session.scalar(func.sum(MealRollup.meals).select()) == 3
+    assert db.session.scalar(func.sum(RevenueRollup.amount).select()) == 40
+    state = db.session.get(RollupState, STATE_NAME)
+    assert state.refreshed_at is not None
+    assert state.claimed_until is None
+    assert RollupChange.query.count() == 0
+
+def test_refresh_applies_logged_changes_to_old_and_new_days(app_context):
+    student = make_user('student')
+    add_data(student.id)
+    refresh_rollups()
+
+    meal = Meal.query.filter_by(meal_date=NOON - timedelta(days=2)).one()
+    meal.meal_date = NOON + timedelta(days=5)
+    db.session.add(Payment(user_id=student.id, amount=15, payment_type='one-time', status='completed',
+                           created_at=NOON - timedelta(days=1)))
+    db.session.commit()
+    assert RollupChange.query.count() == 3
+
+    assert refresh_rollups() == 3
+    incremental = rollup_rows()
+    rebuild_rollups()
+    assert rollup_rows() == incremental
+    days = [row[0] for row in incremental[0]]
+    assert (NOON - timedelta(days=2)).date() not in days
+    assert (NOON + timedelta(days=5)).date() in days
+
+def test_refresh_skips_while_another_process_holds_the_claim(app_context):
+    student = make_user('student')
+    add_data(student.id)
+    refresh_rollups()
+    db.session.add(Meal(user_id=student.id, meal_type='dinner', meal_date=NOON))
+    db.session.commit()
+
+    state = db.session.get(RollupState, STATE_NAME)
+    state.claimed_until = datetime.utcnow() + timedelta(minutes=1)
+    db.session.commit()
+    assert refresh_rollups() == 0
+    assert rebuild_rollups() is None
+    assert RollupChange.query.count() == 1
+
+    # A claim past its lease belongs to a process that died
+    state.claimed_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert refresh_rollups() == 1
+    assert RollupChange.query.count() == 0
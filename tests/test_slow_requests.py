@@ -0,0 +1,59 @@
+from conftest import make_user, login
+from utils import slow_requests
+
+def _records(app):
+    return list(app.extensions['slow_requests'].records())
+
+def _count_rss_reads(monkeypatch):
+    reads = []
+    monkeypatch.setattr(slow_requests, 'current_rss_kb', lambda: reads.append(1) or 1024)
+    return reads
+
+def test_fast_requests_are_not_captured_or_measured(app, client, monkeypatch):
+    reads = _count_rss_reads(monkeypatch)
+    before = len(_records(app))
+    client.get('/login')
+    assert len(_records(app)) == before
+    assert reads == []
+
+def test_slow_request_is_captured_with_its_statements(app, client, monkeypatch):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    reads = _count_rss_reads(monkeypatch)
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_THRESHOLD_MS', 0)
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_LOG_AFTER_MS', 0)
+    client.get('/meal-history')
+
+    record = _records(app)[0]
+    assert record['path'] == '/meal-history'
+    assert record['rss_kb'] == 1024
+    assert reads == [1]
+    assert len(record['statements']) == record['db_statements'] > 0
+    assert not record['statements_truncated']
+
+def test_admin_pages_show_captures(app, client, monkeypatch):
+    with app.app_context():
+        make_user('admin', role='admin')
+    login(client, 'admin')
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_THRESHOLD_MS', 0)
+    client.get('/admin/api/changes?type=users')
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_THRESHOLD_MS', 60_000)
+
+    record = _records(app)[0]
+    assert client.get('/admin/slow-requests').status_code == 200
+    detail = client.get(f"/admin/slow-requests/{record['id']}")
+    assert detail.status_code == 200
+    assert b'Worker memory' in detail.data
+
+def test_statements_before_the_log_mark_are_not_kept(app, client, monkeypatch):
+    with app.app_context():
+        make_user('alice')
+    login(client, 'alice')
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_THRESHOLD_MS', 0)
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_LOG_AFTER_MS', 60_000)
+    client.get('/meal-history')
+
+    record = _records(app)[0]
+    assert record['statements'] == []
+    assert record['statements_truncated']
@@ -0,0 +1,42 @@
+import time
+import pytest
+from flask import g
+from sqlalchemy.exc import OperationalError
+from models import db
+from utils.statement_deadlines import is_deadline_error, parse_deadlines
+
+# Cheap to start, endless to fetch
+COUNT_FOREVER = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT x FROM c'
+
+def test_parse_deadlines():
+    assert parse_deadlines('admin.analytics=5000, admin.manage_users=2000,') == {
+        'admin.analytics': 5000, 'admin.manage_users': 2000}
+
+def test_deadline_covers_fetching_the_rows(app):
+    with app.test_request_context():
+        g.statement_deadline_ms = 50
+        with db.engine.connect() as conn:
+            result = conn.exec_driver_sql(COUNT_FOREVER)
+            started = time.monotonic()
+            with pytest.raises(OperationalError) as excinfo:
+                while time.monotonic() - started < 5:
+                    result.fetchmany(1000)
+            assert is_deadline_error(excinfo.value)
+            assert time.monotonic() - started < 2
+            conn.rollback()
+
+        # Back in the pool the connection no longer has a deadline
+        g.statement_deadline_ms = None
+        with db.engine.connect() as conn:
+            assert 'statement_deadline' not in conn.info
+            rows = conn.exec_driver_sql(COUNT_FOREVER + ' LIMIT 300000').fetchall()
+            assert len(rows) == 300000
+
+def test_every_statement_gets_the_full_deadline(app):
+    with app.test_request_context():
+        g.statement_deadline_ms = 200
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                conn.exec_driver_sql('SELECT 1').fetchall()
+                time.sleep(0.1)
+            assert conn.exec_driver_sql('SELECT 2').scalar() == 2
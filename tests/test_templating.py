@@ -0,0 +1,16 @@
+import os
+from utils.templating import warm_up
+
+def test_bytecode_cache_is_written_under_the_configured_dir(app):
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+    app.jinja_env.cache.clear()
+    app.jinja_env.get_template('auth/login.html')
+    assert any(name.endswith('.cache') for name in os.listdir(cache_dir))
+
+def test_warm_up_compiles_every_template(app):
+    app.jinja_env.cache.clear()
+    templates = app.jinja_env.list_templates(extensions=['html'])
+    assert warm_up(app) == len(templates)
+    assert len(app.jinja_env.cache) >= len(templates)
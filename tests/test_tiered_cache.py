@@ -0,0 +1,67 @@
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from extensions import cache
+from models import db, CacheInvalidation
+from utils.tiered_cache import tiered_cache
+
+@pytest.fixture
+def statements(app_context):
+    seen = []
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+class Source:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+def _invalidate_elsewhere(key):
+    # What another worker's invalidate() leaves behind
+    with db.engine.begin() as conn:
+        conn.execute(CacheInvalidation.__table__.insert().values(key=key, created_at=datetime.utcnow()))
+    cache.delete(key)
+
+def test_shared_tier_hit_runs_no_queries(statements):
+    source = Source()
+    assert tiered_cache.get_or_compute('k', source, ttl=60) == 'value 1'
+
+    # Another worker: nothing local, but in sync
+    tiered_cache.local.clear()
+    tiered_cache.synced = time.monotonic()
+    del statements[:]
+    assert tiered_cache.get_or_compute('k', source, ttl=60) == 'value 1'
+    assert source.calls == 1
+    assert statements == []
+
+def test_invalidate_recomputes(app_context):
+    source = Source()
+    tiered_cache.get_or_compute('k', source, ttl=60)
+    tiered_cache.invalidate('k')
+    assert tiered_cache.get_or_compute('k', source, ttl=60) == 'value 2'
+
+def test_value_computed_across_an_invalidation_is_not_stored(app_context):
+    def compute():
+        _invalidate_elsewhere('k')
+        return 'old'
+    assert tiered_cache.get_or_compute('k', compute, ttl=60) == 'old'
+    assert cache.get('k') is None
+    assert 'k' not in tiered_cache.local
+
+def test_new_worker_starts_from_the_last_invalidations(app_context):
+    tiered_cache.get_or_compute('k', Source(), ttl=60)
+    entry = cache.get('k')
+    _invalidate_elsewhere('k')
+    cache.set('k', entry)  # written back by a worker that hadn't synced
+
+    tiered_cache.pid = None
+    source = Source()
+    assert tiered_cache.get_or_compute('k', source, ttl=60) == 'value 1'
+    assert source.calls == 1
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from conftest import make_user
+from models import db, User
+from utils.user_search import search_users
+
+def _search(term):
+    return [user.username for user in search_users(User.query, term).all()]
+
+def test_search_follows_inserts_updates_and_deletes(app_context):
+    for name in ('alice', 'malik', 'bob'):
+        make_user(name)
+    assert sorted(_search('ali')) == ['alice', 'malik']
+    assert len(_search('example.com')) == 3
+
+    bob = User.query.filter_by(username='bob').one()
+    bob.username = 'alistair'
+    db.session.commit()
+    assert sorted(_search('ali')) == ['alice', 'alistair', 'malik']
+    db.session.delete(User.query.filter_by(username='malik').one())
+    db.session.commit()
+    assert sorted(_search('ali')) == ['alice', 'alistair']
+    # Too short for trigrams: ILIKE, which still sees bob's old email
+    assert _search('OB') == ['alistair']
+
+def test_migration_creates_and_backfills_the_index():
+    path = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'versions', 'e7a91f3c5d24_user_search_index.py')
+    spec = importlib.util.spec_from_file_location('user_search_revision', path)
+    revision = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(revision)
+
+    engine = sa.create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(sa.text('CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, email TEXT)'))
+        conn.execute(sa.text("INSERT INTO users VALUES (1, 'alice', 'alice@example.com')"))
+        with Operations.context(MigrationContext.configure(conn)):
+            revision.upgrade()
+        conn.execute(sa.text("INSERT INTO users VALUES (2, 'malik', 'malik@example.com')"))
+        match = sa.text("SELECT rowid FROM user_search WHERE user_search MATCH '\"ali\"' ORDER BY rowid")
+        assert conn.execute(match).scalars().all() == [1, 2]
+
+        with Operations.context(MigrationContext.configure(conn)):
+            revision.downgrade()
+        assert not sa.inspect(conn).has_table('user_search')
@@ -0,0 +1,124 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+import click
+from utils.instrumentation import request_stats, percentile
+
+logger = logging.getLogger('messmate.access')
+
+class JSONLineFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': datetime.utcfromtimestamp(record.created).isoformat() + 'Z'}
+        entry.update(record.access)
+        return json.dumps(entry, separators=(',', ':'))
+
+class AccessLog:
+    # Requests only put records on an in-memory queue; a listener thread owns
+    # the file, so a slow disk never holds up a response.
+    #
+    # Every gunicorn worker appends to the same file, so the app never rotates
+    # it: renaming from one worker would leave the others writing to the old
+    # file. Rotate it externally (deploy/logrotate.conf); each worker notices
+    # the file has moved and reopens ACCESS_LOG_PATH on its next write.
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self.pid = None
+
+    def _ensure_listener(self):
+        # Threads don't survive fork, so each gunicorn worker starts its own
+        if self.pid == os.getpid():
+            return
+        handler = WatchedFileHandler(self.path)
+        handler.setFormatter(JSONLineFormatter())
+        self.listener = QueueListener(self.queue, handler)
+        self.listener.start()
+        self.pid = os.getpid()
+        atexit.register(self.stop)
+
+    def write(self, entry):
+        self._ensure_listener()
+        logger.info('access', extra={'access': entry})
+
+    def stop(self):
+        if self.listener and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.pid = None
+
+def read_entries(path, since=None):
+    # Oldest rotated file first so entries come out in time order; files
+    # logrotate has compressed are skipped
+    suffixes = sorted(_rotated_suffixes(path), key=lambda s: int(s[1:] or 0), reverse=True)
+    for suffix in suffixes:
+        with open(path + suffix) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or entry['ts'] >= since:
+                    yield entry
+
+def _rotated_suffixes(path):
+    directory, name = os.path.split(path)
+    for filename in os.listdir(directory or '.'):
+        if filename == name:
+            yield ''
+        elif filename.startswith(name + '.') and filename[len(name) + 1:].isdigit():
+            yield filename[len(name):]
+
+def endpoint_percentiles(entries):
+    latencies = defaultdict(list)
+    for entry in entries:
+        latencies[entry.get('endpoint') or '-'].append(entry['total_ms'])
+    return {
+        endpoint: {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+        }
+        for endpoint, values in latencies.items()
+    }
+
+def init_app(app):
+    app.config.setdefault('ACCESS_LOG_ENABLED', os.getenv('ACCESS_LOG_ENABLED', 'True').lower() == 'true')
+    app.config.setdefault('ACCESS_LOG_PATH', os.getenv('ACCESS_LOG_PATH', os.path.join(app.instance_path, 'access.log')))
+
+    access_log = AccessLog(app.config['ACCESS_LOG_PATH'])
+    app.extensions['access_log'] = access_log
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not any(isinstance(h, QueueHandler) for h in logger.handlers):
+        logger.addHandler(QueueHandler(access_log.queue))
+
+    if app.config['ACCESS_LOG_ENABLED']:
+        @app.after_request
+        def log_request(response):
+            stats = request_stats(response)
+            if stats is not None:
+                access_log.write(stats)
+            return response
+
+    @app.cli.command('access-stats')
+    @click.option('--minutes', default=15, help='Only look at requests from the last N minutes.')
+    @click.option('--blueprint', default=None, help='Only show endpoints of this blueprint.')
+    def access_stats(minutes, blueprint):
+        """Show p50/p95/p99 latency per endpoint from the access log."""
+        since = datetime.utcfromtimestamp(time.time() - minutes * 60).isoformat() + 'Z'
+        entries = read_entries(app.config['ACCESS_LOG_PATH'], since)
+        if blueprint:
+            entries = (e for e in entries if e.get('blueprint') == blueprint)
+        stats = endpoint_percentiles(entries)
+        click.echo(f'{"endpoint":<32} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+        for endpoint, row in sorted(stats.items(), key=lambda item: -item[1]['p95']):
+            click.echo(f'{endpoint:<32} {row["count"]:>7} {row["p50"]:9.1f} {row["p95"]:9.1f} {row["p99"]:9.1f}')
@@ -0,0 +1,170 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from blinker import Namespace
+from flask import Response, g, request
+from utils.instrumentation import stats_collectors
+
+# At meal times every student hits the dashboard at once. Only
+# ADMISSION_CONCURRENCY requests per worker run at a time; the rest wait,
+# highest priority class first, until their class's deadline. Requests that
+# can't get in by then, or that would only join an already full or slow
+# queue, get a 503 with Retry-After instead of tying up a thread.
+#
+# The queue lives in gunicorn's spare threads (see gunicorn.conf.py), so
+# GUNICORN_THREADS has to be larger than ADMISSION_CONCURRENCY.
+
+PRIORITIES = {'critical': 0, 'normal': 1, 'low': 2}
+
+# Entries are endpoint=class or blueprint=class; anything unlisted is normal
+DEFAULT_PRIORITIES = (
+    'main.meal_booking=critical,main.cancel_meal=critical,payment=critical,'
+    'auth.login=critical,admin=low'
+)
+# Longest a request of each class may wait for a slot, in seconds
+DEFAULT_MAX_WAIT = 'critical=10,normal=3,low=0.5'
+
+EXEMPT_ENDPOINTS = {'static', 'metrics'}
+
+signals = Namespace()
+# Sent with endpoint, priority and reason ('queue_full', 'slow_queue', 'deadline')
+request_shed = signals.signal('request-shed')
+
+def parse_classes(value, convert=str):
+    classes = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        key, name = entry.split('=', 1)
+        classes[key.strip()] = convert(name.strip())
+    return classes
+
+class Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+        self.evicted = False
+
+class AdmissionController:
+    def __init__(self, concurrency, max_queue):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queue = []
+        self.queued = 0
+        self.order = itertools.count()
+        # Moving average of time spent queued, for shedding before queuing
+        self.wait_average = 0.0
+
+    def _record_wait(self, seconds):
+        self.wait_average = 0.8 * self.wait_average + 0.2 * seconds
+
+    def acquire(self, priority, max_wait):
+        # Returns (admitted, seconds waited, shed reason)
+        with self.lock:
+            if self.active < self.concurrency and not self.queued:
+                self.active += 1
+                self._record_wait(0.0)
+                return True, 0.0, None
+            if self.queued >= self.max_queue and not self._evict_below(priority):
+                return False, 0.0, 'queue_full'
+            if self.wait_average > max_wait:
+                return False, 0.0, 'slow_queue'
+            waiter = Waiter()
+            heapq.heappush(self.queue, (priority, next(self.order), waiter))
+            self.queued += 1
+
+        start = time.monotonic()
+        waiter.event.wait(max_wait)
+        waited = time.monotonic() - start
+        with self.lock:
+            if not waiter.granted and not waiter.cancelled:
+                # Left in the heap; _grant_next skips cancelled waiters
+                waiter.cancelled = True
+                self.queued -= 1
+            self._record_wait(waited)
+        if waiter.granted:
+            return True, waited, None
+        return False, waited, 'queue_full' if waiter.evicted else 'deadline'
+
+    def _evict_below(self, priority):
+        # A full queue still takes a request that outranks someone in it;
+        # the lowest-priority, most recent waiter is turned away instead
+        waiting = [entry for entry in self.queue if not entry[2].cancelled]
+        if not waiting:
+            return False
+        worst = max(waiting, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            return False
+        waiter = worst[2]
+        waiter.cancelled = waiter.evicted = True
+        self.queued -= 1
+        waiter.event.set()
+        return True
+
+    def _grant_next(self):
+        while self.queue:
+            _, _, waiter = heapq.heappop(self.queue)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self.queued -= 1
+            self.active += 1
+            waiter.event.set()
+            return
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+            self._grant_next()
+
+def request_priority(priorities):
+    name = priorities.get(request.endpoint, priorities.get(request.blueprint, 'normal'))
+    return name, PRIORITIES[name]
+
+def init_app(app):
+    # Has to be initialized before instrumentation so its hook runs after
+    # request timing starts, and queue time counts towards total_ms
+    app.config.setdefault('ADMISSION_ENABLED', os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true')
+    app.config.setdefault('ADMISSION_CONCURRENCY', int(os.getenv('ADMISSION_CONCURRENCY', 4)))
+    app.config.setdefault('ADMISSION_MAX_QUEUE', int(os.getenv('ADMISSION_MAX_QUEUE', 12)))
+    app.config.setdefault('ADMISSION_RETRY_AFTER', int(os.getenv('ADMISSION_RETRY_AFTER', 5)))
+    app.config.setdefault('ADMISSION_PRIORITIES', parse_classes(
+        os.getenv('ADMISSION_PRIORITIES', DEFAULT_PRIORITIES)))
+    app.config.setdefault('ADMISSION_MAX_WAIT', parse_classes(
+        os.getenv('ADMISSION_MAX_WAIT', DEFAULT_MAX_WAIT), float))
+    if not app.config['ADMISSION_ENABLED']:
+        return
+
+    controller = AdmissionController(app.config['ADMISSION_CONCURRENCY'], app.config['ADMISSION_MAX_QUEUE'])
+    app.extensions['admission'] = controller
+
+    def admit():
+        if request.endpoint in EXEMPT_ENDPOINTS:
+            return
+        name, priority = request_priority(app.config['ADMISSION_PRIORITIES'])
+        admitted, waited, reason = controller.acquire(priority, app.config['ADMISSION_MAX_WAIT'][name])
+        g.queue_ms = round(waited * 1000, 2)
+        if admitted:
+            g.admitted = True
+            return
+        request_shed.send(app, endpoint=request.endpoint, priority=name, reason=reason)
+        retry_after = max(app.config['ADMISSION_RETRY_AFTER'], math.ceil(controller.wait_average))
+        return Response('The server is busy right now, please try again in a few seconds.', 503,
+                        {'Retry-After': str(retry_after)}, mimetype='text/plain')
+
+    app.before_request_funcs.setdefault(None, []).insert(0, admit)
+
+    def collect(response):
+        return {'queue_ms': g.queue_ms} if 'queue_ms' in g else {}
+
+    if collect not in stats_collectors:
+        stats_collectors.append(collect)
+
+    @app.teardown_request
+    def release(exc):
+        if g.pop('admitted', False):
+            controller.release()
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from models import db, MealRollup, RevenueRollup
+
+# Time series for the admin analytics API, answered from the daily rollups:
+# one grouped read of at most (days x dimension values) rows, bucketed into
+# weeks or months here so the same SQL runs on every database.
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Which dimensions each rollup can be broken down by; a requested dimension
+# a rollup doesn't have is left out of that rollup's series
+DIMENSIONS = {
+    'meals': ('meal_type', 'status', 'plan_type'),
+    'revenue': ('payment_type', 'status', 'plan_type'),
+}
+
+class AnalyticsQueryError(ValueError):
+    pass
+
+class AnalyticsQuery:
+    def __init__(self, start, end, granularity, dimensions):
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.dimensions = dimensions
+
+    def cache_key(self):
+        return f"analytics:api:{self.start}:{self.end}:{self.granularity}:{','.join(self.dimensions)}"
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise AnalyticsQueryError(f'{name} must be a date in YYYY-MM-DD format')
+
+def parse_query(args, max_days):
+    today = datetime.utcnow().date()
+    end = _parse_date(args['end'], 'end') if args.get('end') else today
+    start = _parse_date(args['start'], 'start') if args.get('start') else end - timedelta(days=29)
+    if start > end:
+        raise AnalyticsQueryError('start must not be after end')
+    if (end - start).days + 1 > max_days:
+        raise AnalyticsQueryError(f'date range is limited to {max_days} days')
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise AnalyticsQueryError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    known = set(DIMENSIONS['meals']) | set(DIMENSIONS['revenue'])
+    dimensions = [name.strip() for name in args.get('dimensions', '').split(',') if name.strip()]
+    unknown = [name for name in dimensions if name not in known]
+    if unknown:
+        raise AnalyticsQueryError(f"unknown dimension(s): {', '.join(unknown)}")
+    # Sorted and deduplicated so equivalent requests share a cache entry
+    return AnalyticsQuery(start, end, granularity, sorted(set(dimensions)))
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def _series(model, measures, dimensions, query):
+    columns = [getattr(model, name) for name in dimensions]
+    rows = db.session.query(
+        model.day, *columns, *[func.sum(getattr(model, name)) for name in measures]
+    ).filter(
+        model.day.between(query.start, query.end)
+    ).group_by(model.day, *columns).all()
+
+    buckets = defaultdict(lambda: [0] * len(measures))
+    for row in rows:
+        day = row[0] if isinstance(row[0], date) else _parse_date(row[0], 'day')
+        key = (period_start(day, query.granularity).isoformat(),) + tuple(row[1:1 + len(columns)])
+        totals = buckets[key]
+        for i, value in enumerate(row[1 + len(columns):]):
+            totals[i] += value or 0
+    series = []
+    for key in sorted(buckets, key=lambda key: tuple('' if part is None else part for part in key)):
+        point = {'period': key[0]}
+        point.update(zip(dimensions, key[1:]))
+        point.update(zip(measures, buckets[key]))
+        series.append(point)
+    return series
+
+def analytics_series(query):
+    result = {
+        'start': query.start.isoformat(),
+        'end': query.end.isoformat(),
+        'granularity': query.granularity,
+        'dimensions': query.dimensions,
+    }
+    for name, model, measures in (('meals', MealRollup, ('meals',)),
+                                  ('revenue', RevenueRollup, ('payments', 'amount'))):
+        dimensions = [dim for dim in query.dimensions if dim in DIMENSIONS[name]]
+        result[name] = {'dimensions': dimensions, 'series': _series(model, measures, dimensions, query)}
+    return result
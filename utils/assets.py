@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import click
+
+MANIFEST_NAME = 'manifest.json'
+ONE_YEAR = 365 * 24 * 60 * 60
+
+def fingerprinted_name(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest[:12]}{ext}'
+
+def build_manifest(static_folder):
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if filename == MANIFEST_NAME:
+                continue
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            manifest[filename] = fingerprinted_name(filename, digest)
+    return manifest
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    # No build step was run (local development): hash the files at boot
+    return build_manifest(static_folder)
+
+def init_app(app):
+    manifest = load_manifest(app.static_folder)
+    originals = {hashed: filename for filename, hashed in manifest.items()}
+    app.extensions['asset_manifest'] = manifest
+
+    # Every url_for('static', filename=...) call gets the hashed name
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    def static(filename):
+        original = originals.get(filename)
+        if original is None:
+            return app.send_static_file(filename)
+
+        # The URL changes whenever the content does, so it never needs revalidating
+        response = app.send_static_file(original)
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Write the content-hashed static asset manifest."""
+        manifest = build_manifest(app.static_folder)
+        with open(os.path.join(app.static_folder, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        click.echo(f'Fingerprinted {len(manifest)} static files')
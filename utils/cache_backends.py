@@ -0,0 +1,104 @@
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from flask_caching.backends.base import BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expiry REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entries_expiry ON cache_entries (expiry);
+'''
+
+# CACHE_BACKEND names; anything else is passed to Flask-Caching as CACHE_TYPE
+BACKENDS = {
+    'simple': 'SimpleCache',
+    'filesystem': 'FileSystemCache',
+    'shared': 'utils.cache_backends.SQLiteCache',
+}
+
+# Expired rows are swept on roughly one write in this many
+PRUNE_EVERY = 100
+
+def cache_type(backend):
+    return BACKENDS.get(backend, backend)
+
+# Cache shared by every worker process on the host through one SQLite file,
+# for deployments without a cache server. Selected with CACHE_BACKEND=shared.
+class SQLiteCache(BaseCache):
+    def __init__(self, path, default_timeout=300, timeout=5.0):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(config['CACHE_SQLITE_PATH'], default_timeout=config['CACHE_DEFAULT_TIMEOUT'])
+
+    def _connection(self):
+        # One connection per thread, reopened in forked workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _expiry(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else float('inf')
+
+    def _prune(self, conn):
+        if random.randrange(PRUNE_EVERY) == 0:
+            conn.execute('DELETE FROM cache_entries WHERE expiry <= ?', (time.time(),))
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND expiry > ?', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def has(self, key):
+        return self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND expiry > ?', (key, time.time())
+        ).fetchone() is not None
+
+    def set(self, key, value, timeout=None):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expiry) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout))
+        )
+        self._prune(conn)
+        return True
+
+    def add(self, key, value, timeout=None):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expiry <= ?', (key, time.time()))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cache_entries (key, value, expiry) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout))
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+        return True
@@ -0,0 +1,52 @@
+import os
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import MealPlan
+from utils.tiered_cache import tiered_cache
+from utils.versioning import changed_scopes
+
+# Active meal plans change a few times a semester but are shown on every
+# booking page. They're cached as plain tuples, so nothing cached is bound
+# to a session or can be modified by a caller.
+
+CATALOG_KEY = 'catalog:meal_plans:active'
+
+PlanView = namedtuple('PlanView', 'id name description price duration meals_included')
+
+# Served stale for this long past CATALOG_CACHE_TIMEOUT while it's refreshed
+CATALOG_STALE_SECONDS = 10 * 60
+
+def _load_active_plans():
+    return tuple(
+        PlanView(plan.id, plan.name, plan.description, plan.price, plan.duration, plan.meals_included)
+        for plan in MealPlan.query.filter_by(is_active=True).order_by(MealPlan.id)
+    )
+
+def active_meal_plans():
+    return tiered_cache.get_or_compute(CATALOG_KEY, _load_active_plans,
+                                       ttl=current_app.config['CATALOG_CACHE_TIMEOUT'],
+                                       stale_ttl=CATALOG_STALE_SECONDS)
+
+def invalidate_meal_plans():
+    tiered_cache.invalidate(CATALOG_KEY)
+
+def _note_plan_changes(session, flush_context):
+    if 'meal_plans' in changed_scopes(session):
+        session.info['meal_plans_changed'] = True
+
+def _after_commit(session):
+    # Only once the change is visible to other workers' reads
+    if session.info.pop('meal_plans_changed', False):
+        invalidate_meal_plans()
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('meal_plans_changed', None)
+
+def init_app(app):
+    app.config.setdefault('CATALOG_CACHE_TIMEOUT', int(os.getenv('CATALOG_CACHE_TIMEOUT', 24 * 60 * 60)))
+    if not event.contains(Session, 'after_flush', _note_plan_changes):
+        event.listen(Session, 'after_flush', _note_plan_changes)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,120 @@
+import os
+from datetime import datetime
+from itsdangerous import BadSignature, URLSafeSerializer
+from flask import current_app
+from sqlalchemy import and_, event, inspect, or_, select
+from sqlalchemy.orm import Session
+from models import db, User, Meal, Subscription, Payment, DataVersion
+from utils.exports import EXPORTS, export_value
+from utils.versioning import IGNORED_COLUMNS, bump_versions
+
+# Rows changed since a cursor, for systems that sync from us (campus ERP,
+# kitchen planning) instead of re-pulling whole exports. Pages are read in
+# (change_seq, id) order and the cursor is the position of the last row
+# returned, signed so clients treat it as opaque.
+#
+# change_seq is handed out at commit, not when a row is written: every
+# transaction that changed tracked rows takes the next number from the
+# change_feed data_versions row just before it commits, and stamps it (and
+# updated_at) on those rows. The row lock on the counter is held until the
+# commit, so numbers become visible in the order they were handed out and a
+# row can never commit behind a cursor a client already has. Logins only
+# touch last_login, so they don't take the lock.
+#
+# Bulk query updates and manual SQL have to set change_seq themselves; rows
+# where it's NULL aren't in the feed. Rows are never deleted by the app
+# (meals and subscriptions are cancelled), so the feed has no deletions.
+
+TRACKED = {'users': User, 'meals': Meal, 'payments': Payment, 'subscriptions': Subscription}
+
+SEQUENCE_SCOPE = 'change_feed'
+
+class CursorError(ValueError):
+    pass
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='change-feed')
+
+def encode_cursor(data_type, change_seq, row_id):
+    return _serializer().dumps([data_type, change_seq, row_id])
+
+def decode_cursor(data_type, cursor):
+    try:
+        cursor_type, change_seq, row_id = _serializer().loads(cursor)
+    except (BadSignature, TypeError, ValueError):
+        raise CursorError('Invalid cursor')
+    if not isinstance(change_seq, int) or not isinstance(row_id, int):
+        raise CursorError('Invalid cursor')
+    if cursor_type != data_type:
+        raise CursorError('Cursor belongs to a different type')
+    return change_seq, row_id
+
+def _has_relevant_changes(obj):
+    state = inspect(obj)
+    for attr in state.mapper.column_attrs:
+        if attr.key in IGNORED_COLUMNS or attr.key in ('updated_at', 'change_seq'):
+            continue
+        if state.attrs[attr.key].history.has_changes():
+            return True
+    return False
+
+def _collect_changes(session, flush_context):
+    # new/dirty still hold their pre-flush state here, and inserted rows
+    # already have their ids
+    changed = session.info.setdefault('change_feed', {})
+    for obj in session.new:
+        if isinstance(obj, tuple(TRACKED.values())):
+            changed.setdefault(obj.__table__, set()).add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, tuple(TRACKED.values())) and _has_relevant_changes(obj):
+            changed.setdefault(obj.__table__, set()).add(obj.id)
+
+def next_change_seq(connection):
+    bump_versions(connection, {SEQUENCE_SCOPE})
+    table = DataVersion.__table__
+    return connection.execute(select(table.c.version).where(table.c.scope == SEQUENCE_SCOPE)).scalar()
+
+def _stamp_changes(session):
+    # Whatever is still pending is flushed first, so it's collected too
+    session.flush()
+    changed = session.info.pop('change_feed', None)
+    if not changed:
+        return
+    connection = session.connection()
+    seq = next_change_seq(connection)
+    now = datetime.utcnow()
+    for table, ids in sorted(changed.items(), key=lambda item: item[0].name):
+        connection.execute(table.update().where(table.c.id.in_(sorted(ids)))
+                           .values(change_seq=seq, updated_at=now))
+
+def _forget_changes(session, previous_transaction):
+    # Only when the whole transaction is gone; rolling back a savepoint
+    # keeps what the outer transaction changed before it
+    if previous_transaction.parent is None:
+        session.info.pop('change_feed', None)
+
+def changes_page(data_type, cursor=None, limit=1000):
+    # Returns (rows, next cursor, whether more rows are ready)
+    model = TRACKED[data_type]
+    columns = list(EXPORTS[data_type][1]) + ['updated_at', 'change_seq']
+    query = select(*[getattr(model, name) for name in columns]).where(model.change_seq.isnot(None))
+    if cursor:
+        change_seq, row_id = decode_cursor(data_type, cursor)
+        query = query.where(or_(model.change_seq > change_seq,
+                                and_(model.change_seq == change_seq, model.id > row_id)))
+    # One extra row tells us whether there's another page
+    rows = [dict(zip(columns, row)) for row in
+            db.session.execute(query.order_by(model.change_seq, model.id).limit(limit + 1))]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(data_type, rows[-1]['change_seq'], rows[-1]['id'])
+    return [{key: export_value(value) for key, value in row.items()} for row in rows], cursor, has_more
+
+def init_app(app):
+    app.config.setdefault('CHANGE_FEED_PAGE_SIZE', int(os.getenv('CHANGE_FEED_PAGE_SIZE', 1000)))
+    app.config.setdefault('CHANGE_FEED_MAX_PAGE_SIZE', int(os.getenv('CHANGE_FEED_MAX_PAGE_SIZE', 10000)))
+    if not event.contains(Session, 'after_flush', _collect_changes):
+        event.listen(Session, 'after_flush', _collect_changes)
+        event.listen(Session, 'before_commit', _stamp_changes)
+        event.listen(Session, 'after_soft_rollback', _forget_changes)
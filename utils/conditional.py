@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import time
+from functools import wraps
+from flask import current_app, g, request, session, make_response
+from flask_login import current_user
+from utils.assets import load_manifest
+from utils.versioning import get_versions, user_scope
+
+def deploy_fingerprint(app):
+    # Changes whenever a deploy changes a template or static file (and so
+    # the fingerprinted asset URLs), so old ETags stop matching. Built from
+    # file contents, so every host running the same code agrees on it.
+    digest = hashlib.sha256()
+    template_folder = os.path.join(app.root_path, app.template_folder)
+    for root, dirs, files in os.walk(template_folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, template_folder).replace(os.sep, '/').encode())
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    digest.update(json.dumps(load_manifest(app.static_folder), sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+def compute_etag(scopes, per_user=True, bucket_seconds=None):
+    scopes = list(scopes() if callable(scopes) else scopes)
+    if per_user and current_user.is_authenticated:
+        scopes.append(user_scope(current_user.id))
+    versions = get_versions(scopes)
+    g.data_versions = versions
+    parts = [current_app.config['ETAG_SALT'], request.full_path]
+    if current_user.is_authenticated:
+        parts.append(str(current_user.id))
+    parts.extend(f'{scope}={versions[scope]}' for scope in sorted(versions))
+    if bucket_seconds:
+        parts.append(str(int(time.time() // bucket_seconds)))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+# A matching If-None-Match returns 304 before the view body runs, so none of
+# its queries or template rendering happen. scopes may be a callable when
+# they depend on the request (e.g. the export type).
+def conditional_view(scopes=(), per_user=True, bucket_seconds=None):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Pending flash messages are rendered into the page once only
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            etag = compute_etag(scopes, per_user, bucket_seconds)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def init_app(app):
+    app.config.setdefault('ETAG_SALT', deploy_fingerprint(app))
@@ -0,0 +1,125 @@
+from collections import Counter
+from datetime import datetime
+import click
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from models import db, User, Meal, Subscription, RefundRequest, AdminCounter
+from utils.upserts import add_to_row
+
+# The admin landing page's totals, kept in admin_counters by the same flush
+# that changes the rows they count, so they commit or roll back together.
+# Bulk query updates and manual SQL bypass the hook; `flask
+# reconcile-counters` (run from cron) recounts everything and fixes drift.
+
+FIXED_COUNTERS = ('users', 'active_subscriptions', 'pending_refunds')
+
+def meals_on(day):
+    return f'meals_on:{day.isoformat()}'
+
+def _before(obj, attr):
+    # Value as of the last flush, for dirty and deleted rows
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+def _counts(obj, value_of):
+    # The counters this row contributes 1 to, given a way to read its columns
+    if isinstance(obj, User):
+        return ['users']
+    if isinstance(obj, Subscription):
+        return ['active_subscriptions'] if value_of(obj, 'status') == 'active' else []
+    if isinstance(obj, RefundRequest):
+        return ['pending_refunds'] if value_of(obj, 'status') == 'pending' else []
+    if isinstance(obj, Meal):
+        meal_date = value_of(obj, 'meal_date')
+        return [meals_on(meal_date.date())] if meal_date else []
+    return []
+
+def changed_counters(session):
+    deltas = Counter()
+    for obj in session.new:
+        deltas.update(_counts(obj, getattr))
+    for obj in session.deleted:
+        deltas.subtract(_counts(obj, _before))
+    for obj in session.dirty:
+        deltas.update(_counts(obj, getattr))
+        deltas.subtract(_counts(obj, _before))
+    return {name: delta for name, delta in deltas.items() if delta}
+
+def apply_deltas(connection, deltas):
+    table = AdminCounter.__table__
+    # Sorted so concurrent writers take row locks in the same order
+    for name in sorted(deltas):
+        # A missing fixed counter means the table hasn't been seeded yet and
+        # the next read reconciles it; a new day's meal counter starts at 0
+        if name in FIXED_COUNTERS:
+            connection.execute(
+                table.update()
+                .where(table.c.name == name)
+                .values(value=table.c.value + deltas[name])
+            )
+        else:
+            add_to_row(connection, table, name, 'value', deltas[name])
+
+def _update_counters(session, flush_context):
+    deltas = changed_counters(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def actual_counts():
+    counts = {
+        'users': User.query.count(),
+        'active_subscriptions': Subscription.query.filter_by(status='active').count(),
+        'pending_refunds': RefundRequest.query.filter_by(status='pending').count(),
+    }
+    day = func.date(Meal.meal_date)
+    for meal_day, count in db.session.query(day, func.count(Meal.id)).group_by(day):
+        counts[f'meals_on:{meal_day}'] = count
+    return counts
+
+def reconcile_counters():
+    # Returns {name: (stored, actual)} for every counter that had drifted
+    actual = actual_counts()
+    stored = {row.name: row.value for row in AdminCounter.query}
+    drift = {}
+    for name in set(actual) | set(stored):
+        if stored.get(name) != actual.get(name, 0):
+            drift[name] = (stored.get(name), actual.get(name, 0))
+    table = AdminCounter.__table__
+    for name, (old, new) in drift.items():
+        if old is None:
+            db.session.execute(table.insert().values(name=name, value=new))
+        else:
+            db.session.execute(table.update().where(table.c.name == name).values(value=new))
+    db.session.commit()
+    return drift
+
+def read_counters(names):
+    rows = dict(db.session.query(AdminCounter.name, AdminCounter.value).filter(AdminCounter.name.in_(names)))
+    if not all(name in rows for name in FIXED_COUNTERS if name in names):
+        reconcile_counters()
+        rows = dict(db.session.query(AdminCounter.name, AdminCounter.value).filter(AdminCounter.name.in_(names)))
+    return {name: rows.get(name, 0) for name in names}
+
+def dashboard_counters():
+    today = meals_on(datetime.utcnow().date())
+    counters = read_counters(list(FIXED_COUNTERS) + [today])
+    return {
+        'total_users': counters['users'],
+        'active_subscriptions': counters['active_subscriptions'],
+        'total_meals_today': counters[today],
+        'pending_refunds': counters['pending_refunds'],
+    }
+
+def init_app(app):
+    if not event.contains(Session, 'after_flush', _update_counters):
+        event.listen(Session, 'after_flush', _update_counters)
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recount the admin dashboard counters and fix any drift."""
+        drift = reconcile_counters()
+        for name, (old, new) in sorted(drift.items()):
+            click.echo(f'{name}: {old} -> {new}')
+        click.echo(f'{len(drift)} counter(s) corrected.')
@@ -0,0 +1,55 @@
+import json
+import os
+import re
+import time
+
+RECORD_ID = re.compile(r'^\d+-\d+$')
+
+class DiskRing:
+    # Keeps the newest `capacity` JSON records in a directory. Every worker
+    # process appends to the same directory, so admin pages see them all.
+
+    def __init__(self, directory, capacity):
+        self.directory = directory
+        self.capacity = capacity
+
+    def _path(self, record_id):
+        return os.path.join(self.directory, f'{record_id}.json')
+
+    def _ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [name[:-5] for name in os.listdir(self.directory)
+               if name.endswith('.json') and RECORD_ID.match(name[:-5])]
+        return sorted(ids, key=lambda record_id: int(record_id.split('-')[0]), reverse=True)
+
+    def append(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        record_id = f'{time.time_ns()}-{os.getpid()}'
+        record = dict(record, id=record_id)
+        tmp_path = self._path(record_id) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, separators=(',', ':'))
+        os.replace(tmp_path, self._path(record_id))
+
+        for old_id in self._ids()[self.capacity:]:
+            try:
+                os.remove(self._path(old_id))
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+        return record_id
+
+    def get(self, record_id):
+        if not RECORD_ID.match(record_id):
+            return None
+        try:
+            with open(self._path(record_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def records(self, limit=None):
+        for record_id in self._ids()[:limit]:
+            record = self.get(record_id)
+            if record is not None:
+                yield record
@@ -0,0 +1,252 @@
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from blinker import Namespace
+from flask import current_app, url_for
+from flask_mail import Message
+from sqlalchemy.exc import IntegrityError
+from extensions import mail
+from models import db, User, ExportJob
+from utils.exports import export_filename, export_scope, export_stream, FORMATS
+from utils.instrumentation import external_call
+from utils.versioning import get_version
+
+# Exports too big to stream inside a request run as jobs: export_data with
+# mode=job queues one and answers 202 with its id straight away. A small
+# thread pool in the worker writes the file under EXPORT_DIR in chunks; the
+# admin polls the job and downloads the file once it's done.
+#
+# A job's key covers its parameters and the exported table's data version,
+# so asking again for the same export while the data hasn't changed returns
+# the queued, running or finished job instead of starting another. Files
+# are kept for EXPORT_RETENTION_HOURS.
+#
+# Queued jobs only live in the pool of the process that queued them. Each
+# worker requeues the ones left behind by a restart on its first request,
+# and prune_exports fails any still queued after EXPORT_JOB_TIMEOUT, so
+# they give up their key either way.
+
+signals = Namespace()
+# Sent with job_id and status ('done' or 'failed')
+export_finished = signals.signal('export-finished')
+
+# Running jobs write their size to the database about this often, in bytes
+PROGRESS_EVERY = 4 * 1024 * 1024
+
+def job_key(data_type, fmt, compressed, start, end, partition):
+    parts = [data_type, fmt, str(bool(compressed)), str(start), str(end), str(partition),
+             str(get_version(export_scope(data_type)))]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def job_path(job):
+    return os.path.join(current_app.config['EXPORT_DIR'], f'{job.id}.{FORMATS[job.format][1]}')
+
+def job_filename(job):
+    return export_filename(job.data_type, job.format, job.compressed)
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'type': job.data_type,
+        'format': job.format,
+        'size': job.size,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+    }
+
+class ExportRunner:
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+        self.started_at = datetime.utcnow()
+        self.resumed_pid = None
+
+    def _pool(self):
+        # One pool per worker process; forked workers don't inherit threads
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.app.config['EXPORT_JOB_WORKERS'],
+                                                   thread_name_prefix='export-job')
+                self.pid = os.getpid()
+            return self.executor
+
+    def start(self, job_id, download_url=None):
+        self._pool().submit(self._run_in_context, job_id, download_url)
+
+    def resume(self):
+        # Requeues jobs queued before this process started; whichever worker
+        # claims one first runs it. Once per process.
+        with self.lock:
+            if self.resumed_pid == os.getpid():
+                return 0
+            self.resumed_pid = os.getpid()
+        prune_exports()
+        jobs = ExportJob.query.filter(ExportJob.status == 'queued', ExportJob.created_at < self.started_at) \
+            .order_by(ExportJob.created_at).all()
+        for job in jobs:
+            self.start(job.id, url_for('admin.download_export', job_id=job.id, _external=True))
+        return len(jobs)
+
+    def _run_in_context(self, job_id, download_url):
+        with self.app.app_context():
+            try:
+                run_job(job_id, download_url)
+            except Exception:
+                self.app.logger.exception('Export job %s failed', job_id)
+            finally:
+                db.session.remove()
+
+def submit_export(data_type, fmt, compressed, start, end, partition, user_id):
+    # Returns (job, created)
+    prune_exports()
+    key = job_key(data_type, fmt, compressed, start, end, partition)
+    existing = ExportJob.query.filter_by(active_key=key).first()
+    if existing is not None:
+        return existing, False
+    job = ExportJob(id=uuid.uuid4().hex, active_key=key, data_type=data_type, format=fmt,
+                    compressed=compressed, start_date=start, end_date=end, partition=partition,
+                    requested_by=user_id)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Someone else queued the same export between our check and insert
+        db.session.rollback()
+        return ExportJob.query.filter_by(active_key=key).first(), False
+    # Built here, while there's a request to take the host from
+    download_url = url_for('admin.download_export', job_id=job.id, _external=True)
+    current_app.extensions['export_jobs'].start(job.id, download_url)
+    return job, True
+
+def _set(job_id, **values):
+    db.session.execute(ExportJob.__table__.update().where(ExportJob.id == job_id).values(**values))
+    db.session.commit()
+
+def run_job(job_id, download_url=None):
+    table = ExportJob.__table__
+    # Claimed with a conditional update, so only one thread or process runs it
+    claimed = db.session.execute(
+        table.update().where(table.c.id == job_id, table.c.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+    job = db.session.get(ExportJob, job_id)
+    path = job_path(job)
+    partial = path + '.part'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        written, reported = 0, 0
+        with open(partial, 'wb') as out:
+            for chunk in export_stream(job.data_type, job.format, job.compressed,
+                                       job.start_date, job.end_date, job.partition):
+                out.write(chunk)
+                written += len(chunk)
+                if written - reported >= PROGRESS_EVERY:
+                    _set(job_id, size=written)
+                    reported = written
+        os.replace(partial, path)
+    except Exception as exc:
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        # Failed jobs give up their key, so asking again retries
+        _set(job_id, status='failed', error=str(exc) or exc.__class__.__name__,
+             active_key=None, finished_at=datetime.utcnow())
+        export_finished.send(current_app._get_current_object(), job_id=job_id, status='failed')
+        raise
+    now = datetime.utcnow()
+    retention = timedelta(hours=current_app.config['EXPORT_RETENTION_HOURS'])
+    _set(job_id, status='done', size=written, finished_at=now, expires_at=now + retention)
+    export_finished.send(current_app._get_current_object(), job_id=job_id, status='done')
+    if current_app.config['EXPORT_NOTIFY_EMAIL'] and download_url:
+        notify_requester(db.session.get(ExportJob, job_id), download_url)
+
+def notify_requester(job, download_url):
+    user = db.session.get(User, job.requested_by) if job.requested_by else None
+    if user is None:
+        return
+    msg = Message('Your export is ready', recipients=[user.email])
+    msg.body = f'''
+    Your {job.data_type} export ({job_filename(job)}) is ready:
+    {download_url}
+
+    It will be deleted after {job.expires_at:%Y-%m-%d %H:%M} UTC.
+    '''
+    try:
+        with external_call('smtp', 'export_ready'):
+            mail.send(msg)
+    except Exception:
+        current_app.logger.exception('Could not send export notification for job %s', job.id)
+
+def prune_exports():
+    # Deletes expired files and their jobs, and fails jobs that have been
+    # running for longer than EXPORT_JOB_TIMEOUT (their worker has died) or
+    # queued for that long (no worker ever picked them up). Returns the
+    # number of jobs removed.
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['EXPORT_JOB_TIMEOUT'])
+    table = ExportJob.__table__
+    db.session.execute(
+        table.update().where(table.c.status == 'running', table.c.started_at < stale)
+        .values(status='failed', error='Timed out', active_key=None, finished_at=now)
+    )
+    db.session.execute(
+        table.update().where(table.c.status == 'queued', table.c.created_at < stale)
+        .values(status='failed', error='Never started', active_key=None, finished_at=now)
+    )
+    expired = ExportJob.query.filter(ExportJob.expires_at < now).all()
+    for job in expired:
+        path = job_path(job)
+        if os.path.exists(path):
+            os.remove(path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(expired)
+
+def init_app(app):
+    app.config.setdefault('EXPORT_DIR', os.getenv('EXPORT_DIR', os.path.join(app.instance_path, 'exports')))
+    app.config.setdefault('EXPORT_RETENTION_HOURS', float(os.getenv('EXPORT_RETENTION_HOURS', 24)))
+    app.config.setdefault('EXPORT_JOB_WORKERS', int(os.getenv('EXPORT_JOB_WORKERS', 2)))
+    app.config.setdefault('EXPORT_JOB_TIMEOUT', int(os.getenv('EXPORT_JOB_TIMEOUT', 3600)))
+    # URL prefix of an internal nginx location serving EXPORT_DIR; when set,
+    # downloads are handed to nginx with X-Accel-Redirect
+    app.config.setdefault('EXPORT_ACCEL_PREFIX', os.getenv('EXPORT_ACCEL_PREFIX', ''))
+    app.config.setdefault('EXPORT_NOTIFY_EMAIL', os.getenv('EXPORT_NOTIFY_EMAIL', 'False').lower() == 'true')
+    runner = app.extensions['export_jobs'] = ExportRunner(app)
+
+    @app.before_request
+    def resume_export_jobs():
+        if runner.resumed_pid == os.getpid():
+            return
+        try:
+            runner.resume()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Could not requeue export jobs')
+
+    @app.cli.command('run-export-jobs')
+    def run_export_jobs_command():
+        """Run queued export jobs, e.g. ones left behind by a restart."""
+        for job in ExportJob.query.filter_by(status='queued').order_by(ExportJob.created_at).all():
+            job_id = job.id
+            try:
+                run_job(job_id)
+                click.echo(f'{job_id}: done')
+            except Exception as exc:
+                click.echo(f'{job_id}: failed ({exc})')
+
+    @app.cli.command('prune-exports')
+    def prune_exports_command():
+        """Delete export files past their retention and fail stuck or abandoned jobs."""
+        click.echo(f'{prune_exports()} expired export(s) deleted.')
@@ -0,0 +1,252 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select
+from models import db, User, Meal, Subscription, Payment, RefundRequest
+from utils.analytics import period_start
+
+# Admin data exports, streamed: only the exported columns are selected, rows
+# are fetched yield_per at a time (a server-side cursor on PostgreSQL and
+# MySQL) and encoded straight into the response. Memory stays flat however
+# many rows there are, and the first bytes go out as soon as the query starts
+# returning rows.
+
+EXPORTS = {
+    'users': (User, ('id', 'username', 'email', 'role', 'created_at')),
+    'meals': (Meal, ('id', 'user_id', 'meal_type', 'meal_date', 'status')),
+    'payments': (Payment, ('id', 'user_id', 'amount', 'payment_type', 'status', 'subscription_id', 'created_at')),
+    'subscriptions': (Subscription, ('id', 'user_id', 'plan_type', 'start_date', 'end_date', 'status', 'created_at')),
+    'refunds': (RefundRequest, ('id', 'payment_id', 'user_id', 'status', 'created_at', 'processed_at', 'processed_by')),
+}
+
+# The column start/end filter on, and that partitioned exports are ordered by
+DATE_COLUMNS = {
+    'users': 'created_at',
+    'meals': 'meal_date',
+    'payments': 'created_at',
+    'subscriptions': 'start_date',
+    'refunds': 'created_at',
+}
+
+FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+# Written with pyarrow, which is only needed for these
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+# Low-cardinality text columns, stored dictionary-encoded in columnar exports
+DICTIONARY_COLUMNS = {'role', 'meal_type', 'status', 'payment_type', 'plan_type'}
+
+# Rows per Parquet row group / Arrow record batch
+ROW_GROUP_SIZE = 64 * 1024
+
+# Rows fetched from the database per round trip
+BATCH_SIZE = 1000
+
+# Encoded output is handed to the server in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+def export_scope(data_type):
+    # The data_versions scope the export's ETag depends on
+    model = EXPORTS[data_type][0] if data_type in EXPORTS else None
+    return model.__tablename__ if model is not None else data_type
+
+def export_filename(data_type, fmt, compress=False):
+    return f"{data_type}.{FORMATS[fmt][1]}{'.gz' if compress else ''}"
+
+_columnar_available = None
+
+def columnar_available():
+    # Imported rather than just looked up: pyarrow can be installed and still
+    # fail to import, e.g. against a NumPy it wasn't built for
+    global _columnar_available
+    if _columnar_available is None:
+        try:
+            import pyarrow.parquet  # noqa: F401
+            _columnar_available = True
+        except ImportError:
+            _columnar_available = False
+    return _columnar_available
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def export_rows(data_type, start=None, end=None, by_date=False):
+    # start and end are dates, both inclusive
+    model, columns = EXPORTS[data_type]
+    date_column = getattr(model, DATE_COLUMNS[data_type])
+    query = select(*[getattr(model, name) for name in columns])
+    if start is not None:
+        query = query.where(date_column >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.where(date_column < datetime.combine(end + timedelta(days=1), time.min))
+    query = query.order_by(date_column, model.id) if by_date else query.order_by(model.id)
+    for row in db.session.execute(query.execution_options(yield_per=BATCH_SIZE)):
+        yield dict(zip(columns, row))
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _json_chunks(rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps({key: export_value(value) for key, value in row.items()})
+        separator = ','
+    yield ']'
+
+def _ndjson_chunks(rows):
+    for row in rows:
+        yield json.dumps({key: export_value(value) for key, value in row.items()}) + '\n'
+
+def _csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(['' if value is None else export_value(value) for value in row.values()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def encode(data_type, fmt, rows):
+    if fmt == 'csv':
+        return _csv_chunks(rows, EXPORTS[data_type][1])
+    if fmt == 'ndjson':
+        return _ndjson_chunks(rows)
+    return _json_chunks(rows)
+
+def _batched(pieces):
+    # Joins many small pieces so each write to the socket carries a useful
+    # amount of data; the first piece goes out on its own for a fast start
+    batch, size, first = [], 0, True
+    for piece in pieces:
+        batch.append(piece.encode())
+        size += len(batch[-1])
+        if first or size >= CHUNK_BYTES:
+            yield b''.join(batch)
+            batch, size, first = [], 0, False
+    if batch:
+        yield b''.join(batch)
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        # A sync flush per chunk, so the client receives data as it's produced
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    # A write-only file for pyarrow that hands back what's been written so
+    # far, so a Parquet or Arrow file can be streamed while it's being built
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+def _arrow_type(pa, column):
+    if column.key in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(column.type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    return pa.string()
+
+def arrow_schema(pa, data_type):
+    model, columns = EXPORTS[data_type]
+    return pa.schema([(name, _arrow_type(pa, model.__table__.c[name])) for name in columns])
+
+def columnar_stream(data_type, fmt, start=None, end=None, partition=None):
+    # With a partition (day, week or month), rows come out in date order and
+    # each row group holds a single period, so readers can skip whole
+    # periods using the row group statistics
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(pa, data_type)
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(
+            compression='zstd', emit_dictionary_deltas=True))
+    date_column = DATE_COLUMNS[data_type]
+    columns = {name: [] for name in schema.names}
+    current, count = None, 0
+    # An Arrow IPC file can't replace a dictionary from one record batch to
+    # the next, so each dictionary column keeps one for the whole file that
+    # only grows; later batches are written with just what they added
+    dictionaries = {name: {} for name in schema.names if pa.types.is_dictionary(schema.field(name).type)}
+
+    def column_array(name, values):
+        if name not in dictionaries:
+            return pa.array(values, type=schema.field(name).type)
+        index = dictionaries[name]
+        indices = [None if value is None else index.setdefault(value, len(index)) for value in values]
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(list(index), pa.string()))
+
+    def flush():
+        writer.write_table(pa.Table.from_arrays([column_array(name, columns[name]) for name in schema.names],
+                                                schema=schema))
+        for values in columns.values():
+            values.clear()
+        return sink.drain()
+
+    for row in export_rows(data_type, start, end, by_date=partition is not None):
+        if partition is not None and row[date_column] is not None:
+            period = period_start(row[date_column].date(), partition)
+            if count and period != current:
+                yield flush()
+                count = 0
+            current = period
+        for name, value in row.items():
+            columns[name].append(value)
+        count += 1
+        if count >= ROW_GROUP_SIZE:
+            yield flush()
+            count = 0
+    if count:
+        yield flush()
+    writer.close()
+    yield sink.drain()
+
+def export_stream(data_type, fmt, compress=False, start=None, end=None, partition=None):
+    if fmt in COLUMNAR_FORMATS:
+        # Already compressed column by column
+        return columnar_stream(data_type, fmt, start, end, partition)
+    chunks = _batched(encode(data_type, fmt, export_rows(data_type, start, end)))
+    return _gzipped(chunks) if compress else chunks
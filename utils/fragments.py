@@ -0,0 +1,28 @@
+import os
+import time
+from flask import current_app, g
+from flask_login import current_user
+from utils.tiered_cache import tiered_cache
+from utils.versioning import get_version, user_scope
+
+# Rendered page sections cached per user. The key carries the user's data
+# version, which the versioning flush hook bumps whenever one of their
+# meals, subscriptions, payments or refunds changes, so a write anywhere
+# (cancel_meal, payment_success, the Stripe webhook, the admin) retires the
+# old fragments without anyone having to delete them. The hour bucket rolls
+# "upcoming" and "expires" sections over; the deploy salt rolls template edits.
+
+def fragment_key(name):
+    scope = user_scope(current_user.id)
+    # conditional_view already looked the version up for the ETag
+    version = g.get('data_versions', {}).get(scope)
+    if version is None:
+        version = get_version(scope)
+    bucket = int(time.time() // 3600)
+    return f"fragment:{name}:{scope}:v{version}:h{bucket}:{current_app.config['ETAG_SALT']}"
+
+def cached_fragment(name, render):
+    return tiered_cache.get_or_compute(fragment_key(name), render, ttl=current_app.config['FRAGMENT_CACHE_TTL'])
+
+def init_app(app):
+    app.config.setdefault('FRAGMENT_CACHE_TTL', int(os.getenv('FRAGMENT_CACHE_TTL', 3600)))
@@ -0,0 +1,113 @@
+import math
+import time
+from contextlib import contextmanager
+from blinker import Namespace
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request timings shared by the access log, metrics and slow-request capture
+
+signals = Namespace()
+# Sent with service, operation, duration (seconds) and error after every
+# outbound Stripe/SMTP call
+external_call_finished = signals.signal('external-call-finished')
+
+# Callables taking the response and returning extra fields for request_stats
+stats_collectors = []
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.db_time = 0.0
+    g.db_statements = 0
+    g.render_time = 0.0
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    now = time.perf_counter()
+    elapsed = now - conn.info['query_start'].pop()
+    if has_request_context() and 'request_start' in g:
+        g.db_time += elapsed
+        g.db_statements += 1
+        # Only kept when something (slow-request capture) asked for it, and
+        # only once the request has been running for statement_log_after
+        # seconds, so fast requests never build a log
+        log_after = g.get('statement_log_after')
+        if log_after is not None and now - g.request_start >= log_after:
+            log = g.setdefault('statement_log', [])
+            if len(log) < g.statement_log_limit:
+                log.append({'sql': statement, 'ms': round(elapsed * 1000, 3)})
+
+def _before_render(app, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+def _after_render(app, template, context, **extra):
+    starts = g.get('render_starts')
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        # Only count the outermost render so includes aren't counted twice
+        if not starts:
+            g.render_time += elapsed
+
+@contextmanager
+def external_call(service, operation):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if has_request_context() and 'request_start' in g:
+            g.setdefault('external_calls', []).append({
+                'service': service,
+                'operation': operation,
+                'ms': round(duration * 1000, 2),
+                'error': error,
+            })
+        external_call_finished.send(service, operation=operation, duration=duration, error=error)
+
+def request_stats(response):
+    if 'request_start' not in g:
+        return None
+    if 'request_stats' not in g:
+        g.request_stats = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'blueprint': request.blueprint,
+            'user_id': current_user.get_id(),
+            'status': response.status_code,
+            'db_ms': round(g.db_time * 1000, 2),
+            'db_statements': g.db_statements,
+            'render_ms': round(g.render_time * 1000, 2),
+            'total_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+        }
+        for collector in stats_collectors:
+            g.request_stats.update(collector(response))
+    return g.request_stats
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    # Nearest-rank percentile
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+def init_app(app):
+    if app.extensions.get('instrumentation'):
+        return
+    app.extensions['instrumentation'] = True
+    # Registered first so every other before_request hook is inside the timing
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
@@ -0,0 +1,184 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import click
+from limits import parse
+from limits.storage import Storage, MovingWindowSupport, storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expiry REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS window_entries (
+    key TEXT NOT NULL,
+    atime REAL NOT NULL,
+    amount INTEGER NOT NULL,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS ix_window_entries_key_atime ON window_entries (key, atime);
+CREATE INDEX IF NOT EXISTS ix_counters_expiry ON counters (expiry);
+'''
+
+# Expired rows of keys that are never hit again (a username tried once from
+# one address) are swept on roughly one write in this many
+SWEEP_EVERY = 1000
+
+# Entries written before window_entries had an expires column
+LEGACY_ENTRY_TTL = 24 * 60 * 60
+
+# Rate limit storage shared by every worker process on the host, addressed as
+# sqlite:///relative/path.db or sqlite:////absolute/path.db. Counters survive
+# restarts; the moving window keeps one weighted row per hit.
+class SQLiteStorage(Storage, MovingWindowSupport):
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, timeout=5.0, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        path = uri.split('://', 1)[1] if uri else ''
+        self.path = path[1:] if path.startswith('/') else path or ':memory:'
+        self.timeout = float(timeout)
+        self._local = threading.local()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # One connection per thread, reopened in forked workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(window_entries)')}
+            if 'expires' not in columns:
+                conn.execute('ALTER TABLE window_entries ADD COLUMN expires REAL')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_window_entries_expires ON window_entries (expires)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def sweep(self, conn=None):
+        # Deletes every expired counter and window entry, whatever its key
+        now = time.time()
+        conn = conn or self._connection()
+        swept = conn.execute('DELETE FROM counters WHERE expiry <= ?', (now,)).rowcount
+        swept += conn.execute(
+            'DELETE FROM window_entries WHERE expires <= ? OR (expires IS NULL AND atime < ?)',
+            (now, now - LEGACY_ENTRY_TTL)
+        ).rowcount
+        return swept
+
+    def _maybe_sweep(self, conn):
+        if random.randrange(SWEEP_EVERY) == 0:
+            self.sweep(conn)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        # Take the write lock up front so check-then-insert can't race
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self._transaction() as conn:
+            self._maybe_sweep(conn)
+            conn.execute('DELETE FROM counters WHERE key = ? AND expiry <= ?', (key, now))
+            conn.execute(
+                'INSERT INTO counters (key, value, expiry) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = value + excluded.value, '
+                'expiry = CASE WHEN ? THEN excluded.expiry ELSE expiry END',
+                (key, amount, now + expiry, bool(elastic_expiry))
+            )
+            return conn.execute('SELECT value FROM counters WHERE key = ?', (key,)).fetchone()[0]
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM counters WHERE key = ? AND expiry > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT expiry FROM counters WHERE key = ? AND expiry > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._transaction() as conn:
+            self._maybe_sweep(conn)
+            conn.execute('DELETE FROM window_entries WHERE key = ? AND atime < ?', (key, now - expiry))
+            acquired = conn.execute(
+                'SELECT COALESCE(SUM(amount), 0) FROM window_entries WHERE key = ?', (key,)
+            ).fetchone()[0]
+            if acquired + amount > limit:
+                return False
+            conn.execute(
+                'INSERT INTO window_entries (key, atime, amount, expires) VALUES (?, ?, ?, ?)',
+                (key, now, amount, now + expiry)
+            )
+            return True
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        start, acquired = self._connection().execute(
+            'SELECT MIN(atime), COALESCE(SUM(amount), 0) FROM window_entries '
+            'WHERE key = ? AND atime >= ?', (key, now - expiry)
+        ).fetchone()
+        return (start if start is not None else now), acquired
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def clear(self, key):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM counters WHERE key = ?', (key,))
+            conn.execute('DELETE FROM window_entries WHERE key = ?', (key,))
+
+    def reset(self):
+        with self._transaction() as conn:
+            cleared = conn.execute('DELETE FROM counters').rowcount
+            cleared += conn.execute('DELETE FROM window_entries').rowcount
+        return cleared
+
+def benchmark_storage(uri, hits=2000, limit='200 per day'):
+    storage = storage_from_string(uri)
+    limiter = MovingWindowRateLimiter(storage)
+    item = parse(limit)
+    key = f'bench-{os.getpid()}'
+    start = time.perf_counter()
+    for _ in range(hits):
+        limiter.hit(item, key)
+    elapsed = time.perf_counter() - start
+    limiter.clear(item, key)
+    return elapsed / hits * 1e6
+
+def init_app(app):
+    @app.cli.command('bench-limiter')
+    @click.option('--hits', default=2000, help='Hits per storage backend.')
+    @click.option('--limit', default='200 per day', help='Limit to hit (allowed and rejected hits both count).')
+    def bench_limiter(hits, limit):
+        """Measure the rate limiter's per-request cost for each storage."""
+        for uri in ('memory://', app.config['RATELIMIT_STORAGE_URI']):
+            per_hit = benchmark_storage(uri, hits, limit)
+            click.echo(f'{uri:<60} {per_hit:8.1f} us/hit')
@@ -0,0 +1,237 @@
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from datetime import datetime
+import click
+from flask import g, request
+from sqlalchemy import text
+from models import db
+from utils.access_log import read_entries
+from utils.disk_ring import DiskRing
+from utils.instrumentation import stats_collectors, request_stats, percentile
+
+# Opt-in (MEMORY_TRACKING=True) because tracemalloc slows every allocation in
+# the worker. Each request's peak traced memory goes into request_stats, so it
+# lands in the access log and /metrics next to latency. Peaks are correlated
+# with table sizes offline by `flask memory-stats`.
+
+TRACKED_TABLES = ('users', 'meals', 'payments', 'subscriptions', 'refund_requests')
+HISTORY = 100
+MIN_HISTORY = 10
+MIN_SAMPLES = 20
+MIN_CORRELATION = 0.8
+
+# tracemalloc has one peak per process; with threaded workers only one
+# request at a time is measured so concurrent requests don't blur each other
+_tracking = threading.Lock()
+
+class PeakWatcher(threading.Thread):
+    # Snapshots only survive as long as the objects do, and by after_request
+    # the view's list of dicts is gone. Poll instead and keep the snapshot
+    # taken closest to the peak.
+
+    def __init__(self, interval, baseline):
+        super().__init__(name='memory-peak-watcher', daemon=True)
+        self.interval = interval
+        self.baseline = baseline
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.snapshot_size * 1.25:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.snapshot
+
+class TableSizes:
+    # MAX(id) reads one index page per table; close enough to a row count
+    # for spotting growth and cheap enough to refresh once a minute
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.sizes = {}
+        self.checked = 0.0
+
+    def get(self):
+        if time.monotonic() - self.checked > self.ttl:
+            with db.engine.connect() as conn:
+                self.sizes = {
+                    table: conn.execute(text(f'SELECT COALESCE(MAX(id), 0) FROM {table}')).scalar()
+                    for table in TRACKED_TABLES
+                }
+            self.checked = time.monotonic()
+        return self.sizes
+
+def top_sites(snapshot, baseline, limit):
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ]
+    diff = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'traceback')
+    return [{
+        'size_kb': round(stat.size_diff / 1024, 1),
+        'count': stat.count_diff,
+        'traceback': [[frame.filename, frame.lineno] for frame in stat.traceback],
+    } for stat in diff[:limit] if stat.size_diff > 0]
+
+def growth(samples):
+    # Pearson r and slope (bytes per row) of peak against each table's size
+    results = {}
+    peaks = [entry['peak_alloc_kb'] * 1024 for entry in samples]
+    for table in TRACKED_TABLES:
+        rows = [entry['table_rows'].get(table, 0) for entry in samples]
+        if len(set(rows)) < 2 or len(set(peaks)) < 2:
+            continue
+        r = statistics.correlation(rows, peaks)
+        slope = statistics.linear_regression(rows, peaks).slope
+        results[table] = (r, slope)
+    return results
+
+def endpoint_memory(entries):
+    samples = defaultdict(list)
+    for entry in entries:
+        if 'peak_alloc_kb' in entry:
+            samples[entry.get('endpoint') or '-'].append(entry)
+    report = {}
+    for endpoint, rows in samples.items():
+        peaks = [row['peak_alloc_kb'] for row in rows]
+        grows_with = None
+        if len(rows) >= MIN_SAMPLES:
+            candidates = [(r, table, slope) for table, (r, slope) in growth(rows).items()
+                          if r >= MIN_CORRELATION and slope > 0]
+            if candidates:
+                r, table, slope = max(candidates)
+                grows_with = {'table': table, 'r': r, 'bytes_per_row': slope}
+        report[endpoint] = {
+            'count': len(peaks),
+            'p50': percentile(peaks, 50),
+            'p95': percentile(peaks, 95),
+            'max': max(peaks),
+            'grows_with': grows_with,
+        }
+    return report
+
+def init_app(app):
+    app.config.setdefault('MEMORY_TRACKING', os.getenv('MEMORY_TRACKING', 'False').lower() == 'true')
+    app.config.setdefault('MEMORY_TRACE_FRAMES', int(os.getenv('MEMORY_TRACE_FRAMES', 8)))
+    app.config.setdefault('MEMORY_OUTLIER_FACTOR', float(os.getenv('MEMORY_OUTLIER_FACTOR', 3)))
+    app.config.setdefault('MEMORY_OUTLIER_KB', int(os.getenv('MEMORY_OUTLIER_KB', 50 * 1024)))
+    app.config.setdefault('MEMORY_WATCH_INTERVAL', float(os.getenv('MEMORY_WATCH_INTERVAL', 0.01)))
+    app.config.setdefault('MEMORY_TOP_SITES', int(os.getenv('MEMORY_TOP_SITES', 15)))
+    app.config.setdefault('MEMORY_DUMP_DIR', os.getenv('MEMORY_DUMP_DIR', os.path.join(app.instance_path, 'memory_dumps')))
+    app.config.setdefault('MEMORY_DUMP_KEEP', int(os.getenv('MEMORY_DUMP_KEEP', 50)))
+    app.config.setdefault('MEMORY_TABLE_ROWS_TTL', int(os.getenv('MEMORY_TABLE_ROWS_TTL', 60)))
+    ring = DiskRing(app.config['MEMORY_DUMP_DIR'], app.config['MEMORY_DUMP_KEEP'])
+    app.extensions['memory_dumps'] = ring
+
+    @app.cli.command('memory-stats')
+    @click.option('--minutes', default=24 * 60, help='Only look at requests from the last N minutes.')
+    def memory_stats(minutes):
+        """Show peak traced memory per endpoint and which endpoints grow with table size."""
+        since = datetime.utcfromtimestamp(time.time() - minutes * 60).isoformat() + 'Z'
+        report = endpoint_memory(read_entries(app.config['ACCESS_LOG_PATH'], since))
+        click.echo(f'{"endpoint":<32} {"count":>7} {"p50 KB":>9} {"p95 KB":>9} {"max KB":>9}  grows with')
+        for endpoint, row in sorted(report.items(), key=lambda item: -item[1]['p95']):
+            grows = row['grows_with']
+            note = f"{grows['table']} (r={grows['r']:.2f}, {grows['bytes_per_row']:.0f} B/row)" if grows else ''
+            click.echo(f'{endpoint:<32} {row["count"]:>7} {row["p50"]:9.0f} {row["p95"]:9.0f} {row["max"]:9.0f}  {note}')
+        dumps = list(ring.records(5))
+        if dumps:
+            click.echo('\nRecent allocation dumps (flask memory-dump <id>):')
+            for dump in dumps:
+                click.echo(f"  {dump['id']}  {dump['endpoint']}  peak {dump['peak_alloc_kb']:.0f} KB")
+
+    @app.cli.command('memory-dump')
+    @click.argument('dump_id', required=False)
+    def memory_dump(dump_id):
+        """Print the top allocation sites of a memory dump (the newest by default)."""
+        dump = ring.get(dump_id) if dump_id else next(ring.records(1), None)
+        if dump is None:
+            raise click.ClickException('No such memory dump.')
+        click.echo(f"{dump['method']} {dump['path']} ({dump['endpoint']}) at {dump['created_at']}: "
+                   f"peak {dump['peak_alloc_kb']:.0f} KB, trigger peak {dump['trigger_peak_kb']:.0f} KB")
+        for site in dump['sites']:
+            click.echo(f"\n{site['size_kb']:.1f} KB in {site['count']} blocks")
+            for filename, lineno in site['traceback']:
+                click.echo(f'    {filename}:{lineno}')
+
+    if not app.config['MEMORY_TRACKING']:
+        return
+
+    tracemalloc.start(app.config['MEMORY_TRACE_FRAMES'])
+    table_sizes = TableSizes(app.config['MEMORY_TABLE_ROWS_TTL'])
+    history = defaultdict(lambda: deque(maxlen=HISTORY))
+    # Endpoint -> peak KB of the outlier that armed it. The next request to
+    # an armed endpoint runs under a PeakWatcher and is dumped.
+    armed = {}
+
+    @app.before_request
+    def start_tracking():
+        if not _tracking.acquire(blocking=False):
+            return
+        g.memory_tracking = True
+        if (request.endpoint or '-') in armed:
+            baseline = tracemalloc.take_snapshot()
+            g.memory_watcher = PeakWatcher(app.config['MEMORY_WATCH_INTERVAL'], baseline)
+            g.memory_watcher.start()
+        tracemalloc.reset_peak()
+        g.memory_start = tracemalloc.get_traced_memory()[0]
+
+    def collect(response):
+        if 'memory_start' not in g:
+            return {}
+        peak = tracemalloc.get_traced_memory()[1] - g.memory_start
+        return {'peak_alloc_kb': round(peak / 1024, 1), 'table_rows': table_sizes.get()}
+
+    if collect not in stats_collectors:
+        stats_collectors.append(collect)
+
+    @app.after_request
+    def check_peak(response):
+        if 'memory_start' not in g:
+            return response
+        endpoint = request.endpoint or '-'
+        peak_kb = request_stats(response)['peak_alloc_kb']
+        watcher = g.pop('memory_watcher', None)
+        if watcher is not None:
+            snapshot = watcher.stop()
+            trigger_peak_kb = armed.pop(endpoint, peak_kb)
+            if snapshot is not None:
+                ring.append({
+                    'created_at': datetime.utcnow().isoformat(),
+                    'method': request.method,
+                    'path': request.full_path,
+                    'endpoint': endpoint,
+                    'peak_alloc_kb': peak_kb,
+                    'trigger_peak_kb': trigger_peak_kb,
+                    'sites': top_sites(snapshot, watcher.baseline, app.config['MEMORY_TOP_SITES']),
+                })
+        else:
+            peaks = history[endpoint]
+            outlier = peak_kb >= app.config['MEMORY_OUTLIER_KB'] or (
+                len(peaks) >= MIN_HISTORY
+                and peak_kb > app.config['MEMORY_OUTLIER_FACTOR'] * statistics.median(peaks))
+            if outlier:
+                armed.setdefault(endpoint, peak_kb)
+        history[endpoint].append(peak_kb)
+        return response
+
+    @app.teardown_request
+    def stop_tracking(exc):
+        watcher = g.pop('memory_watcher', None)
+        if watcher is not None:
+            watcher.stop()
+        if g.pop('memory_tracking', False):
+            g.pop('memory_start', None)
+            _tracking.release()
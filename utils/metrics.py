@@ -0,0 +1,169 @@
+import hmac
+import ipaddress
+import os
+import threading
+import time
+from flask import Response, abort, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from sqlalchemy import event
+from extensions import limiter
+from models import db
+from utils.instrumentation import request_stats, external_call_finished
+from utils.admission import request_shed
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker writes
+# its samples to that directory and /metrics sums them across workers
+
+REQUEST_LATENCY = Histogram(
+    'messmate_request_duration_seconds', 'Request latency by Flask endpoint',
+    ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUESTS = Counter(
+    'messmate_requests_total', 'Requests by Flask endpoint and status',
+    ['endpoint', 'method', 'status'])
+REQUEST_DB_TIME = Histogram(
+    'messmate_request_db_seconds', 'Time spent in SQL per request',
+    ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+STATEMENTS = Counter(
+    'messmate_db_statements_total', 'SQL statements executed', ['operation'])
+POOL_CHECKOUT_WAIT = Histogram(
+    'messmate_db_pool_checkout_wait_seconds', 'Time spent waiting to check a connection out of the pool',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+POOL_IN_USE = Gauge(
+    'messmate_db_pool_connections_in_use', 'Connections checked out of the pool',
+    multiprocess_mode='livesum')
+EXTERNAL_LATENCY = Histogram(
+    'messmate_external_call_duration_seconds', 'Outbound Stripe/SMTP call latency',
+    ['service', 'operation'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30))
+EXTERNAL_ERRORS = Counter(
+    'messmate_external_call_errors_total', 'Failed outbound Stripe/SMTP calls',
+    ['service', 'operation', 'error'])
+REQUEST_PEAK_MEMORY = Histogram(
+    'messmate_request_peak_memory_bytes', 'Peak traced allocation per request (MEMORY_TRACKING only)',
+    ['endpoint'],
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6, 1e9))
+REQUEST_QUEUE_WAIT = Histogram(
+    'messmate_request_queue_wait_seconds', 'Time spent waiting for an admission slot',
+    ['endpoint'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUESTS_SHED = Counter(
+    'messmate_requests_shed_total', 'Requests turned away with 503 by admission control',
+    ['endpoint', 'priority', 'reason'])
+RATE_LIMIT_REJECTIONS = Counter(
+    'messmate_rate_limit_rejections_total', 'Requests rejected by the rate limiter',
+    ['endpoint', 'limit'])
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    words = statement.split(None, 1)
+    STATEMENTS.labels(words[0].upper() if words else '').inc()
+
+_checkout_started = threading.local()
+
+_timed_pool_classes = {}
+
+def _timed_pool_class(cls):
+    # The checkout event only fires once the pool has handed a connection
+    # over (after waiting for a free one, or opening one), so the wait is
+    # stamped here first. recreate() on dispose() keeps the class.
+    class TimedPool(cls):
+        __slots__ = ()
+
+        def connect(self):
+            _checkout_started.value = time.perf_counter()
+            return super().connect()
+
+    TimedPool.__name__ = TimedPool.__qualname__ = f'Timed{cls.__name__}'
+    return TimedPool
+
+def _time_checkouts(pool):
+    cls = type(pool)
+    if cls in _timed_pool_classes.values():
+        return
+    if cls not in _timed_pool_classes:
+        _timed_pool_classes[cls] = _timed_pool_class(cls)
+    pool.__class__ = _timed_pool_classes[cls]
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_IN_USE.inc()
+    started = getattr(_checkout_started, 'value', None)
+    if started is not None:
+        _checkout_started.value = None
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+def _checkin(dbapi_connection, connection_record):
+    POOL_IN_USE.dec()
+
+def _instrument_engine(engine):
+    # Listeners go on the app's own engines rather than every Engine and Pool
+    # in the process; pool events follow the engine across dispose()
+    if event.contains(engine, 'before_cursor_execute', _count_statement):
+        return
+    event.listen(engine, 'before_cursor_execute', _count_statement)
+    _time_checkouts(engine.pool)
+    event.listen(engine, 'checkout', _checkout)
+    event.listen(engine, 'checkin', _checkin)
+
+def scrape_allowed(token):
+    # Without METRICS_TOKEN only direct scrapes from this host are served;
+    # anything that came through the proxy carries X-Forwarded-For
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+def _record_external_call(service, operation, duration, error):
+    EXTERNAL_LATENCY.labels(service, operation).observe(duration)
+    if error:
+        EXTERNAL_ERRORS.labels(service, operation, error).inc()
+
+def _record_shed(app, endpoint, priority, reason):
+    REQUESTS_SHED.labels(endpoint or '-', priority, reason).inc()
+
+def _on_rate_limit_breach(request_limit):
+    RATE_LIMIT_REJECTIONS.labels(request.endpoint or '-', str(request_limit.limit)).inc()
+
+def registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+def init_app(app):
+    app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))
+    # Must be set before the limiter is initialized
+    app.config.setdefault('RATELIMIT_ON_BREACH_CALLBACK', _on_rate_limit_breach)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_engine(engine)
+    external_call_finished.connect(_record_external_call)
+    request_shed.connect(_record_shed)
+
+    @app.after_request
+    def observe_request(response):
+        stats = request_stats(response)
+        if stats is not None:
+            endpoint = stats['endpoint'] or '-'
+            REQUEST_LATENCY.labels(endpoint, stats['method']).observe(stats['total_ms'] / 1000)
+            REQUEST_DB_TIME.labels(endpoint).observe(stats['db_ms'] / 1000)
+            REQUESTS.labels(endpoint, stats['method'], str(stats['status'])).inc()
+            if 'queue_ms' in stats:
+                REQUEST_QUEUE_WAIT.labels(endpoint).observe(stats['queue_ms'] / 1000)
+            if 'peak_alloc_kb' in stats:
+                REQUEST_PEAK_MEMORY.labels(endpoint).observe(stats['peak_alloc_kb'] * 1024)
+        return response
+
+    @app.route('/metrics')
+    @limiter.exempt
+    def metrics():
+        if not scrape_allowed(app.config['METRICS_TOKEN']):
+            abort(401)
+        return Response(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
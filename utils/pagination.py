@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+from flask import current_app
+from flask_sqlalchemy.pagination import QueryPagination
+from sqlalchemy import func, select, text
+from extensions import cache
+from models import db
+from utils.versioning import get_version
+
+# Pagination for admin lists without an exact COUNT(*) on every page turn.
+# Totals are cached per filter for PAGINATION_COUNT_TTL seconds, keyed by
+# the table's data version so a write shows up on the next page view.
+# Counting stops after PAGINATION_EXACT_LIMIT rows; past that the total is
+# an estimate (the planner's on PostgreSQL, otherwise a lower bound) and
+# has_next comes from fetching one row more than the page holds. ?exact=1
+# asks for the exact count.
+
+class CountedPagination(QueryPagination):
+    def _query_items(self):
+        query = self._query_args['query']
+        items = query.limit(self.per_page + 1).offset(self._query_offset).all()
+        self.more = len(items) > self.per_page
+        self.estimated = False
+        return items[:self.per_page]
+
+    def _query_count(self):
+        query = self._query_args['query'].order_by(None)
+        scope, count_key = self._query_args['scope'], self._query_args['count_key']
+        digest = hashlib.sha1(count_key.encode()).hexdigest()
+        key = f'pagination:count:{scope}:v{get_version(scope)}:{digest}'
+        if self._query_args['exact']:
+            total, estimated = query.count(), False
+        else:
+            cached = cache.get(key)
+            if cached is not None:
+                self.estimated = cached[1]
+                return self._at_least_seen(cached[0])
+            total, estimated = self._bounded_count(query)
+        self.estimated = estimated
+        cache.set(key, (total, estimated), timeout=current_app.config['PAGINATION_COUNT_TTL'])
+        return self._at_least_seen(total)
+
+    def _bounded_count(self, query):
+        limit = current_app.config['PAGINATION_EXACT_LIMIT']
+        bounded = db.session.scalar(select(func.count()).select_from(query.limit(limit + 1).subquery()))
+        if bounded <= limit:
+            return bounded, False
+        return max(limit + 1, _planner_estimate(query) or 0), True
+
+    def _at_least_seen(self, total):
+        # An estimate (or a stale cached count) mustn't end before this page
+        seen = self._query_offset + len(self.items) + (1 if self.more else 0)
+        return max(total, seen)
+
+    @property
+    def has_next(self):
+        return self.more
+
+def _planner_estimate(query):
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {statement}')).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def paginate(query, page, per_page, scope, count_key, exact=False):
+    # scope is the data_versions scope of the listed table, count_key
+    # identifies the filter (e.g. 'search=bob')
+    return CountedPagination(page=page, per_page=per_page, error_out=False,
+                             query=query, scope=scope, count_key=count_key, exact=exact)
+
+def init_app(app):
+    app.config.setdefault('PAGINATION_COUNT_TTL', int(os.getenv('PAGINATION_COUNT_TTL', 60)))
+    app.config.setdefault('PAGINATION_EXACT_LIMIT', int(os.getenv('PAGINATION_EXACT_LIMIT', 5000)))
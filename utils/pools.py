@@ -0,0 +1,50 @@
+import os
+from flask import Response, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# With WORKER_POOL set, this process belongs to one of several gunicorn pools
+# running the same code behind a reverse proxy (deploy/nginx.conf), so a
+# CSV export in the admin pool can't take a worker away from a booking.
+# Entries are pool=blueprint+blueprint; blueprints not listed belong to
+# DEFAULT_POOL.
+
+DEFAULT_POOL = 'student'
+DEFAULT_POOL_BLUEPRINTS = 'admin=admin'
+
+# Served by every pool: each pool has its own /metrics
+SHARED_ENDPOINTS = {'static', 'metrics'}
+
+def parse_pools(value):
+    pools = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        pool, blueprints = entry.split('=', 1)
+        for blueprint in blueprints.split('+'):
+            pools[blueprint.strip()] = pool.strip()
+    return pools
+
+def pool_for(blueprint, pools):
+    return pools.get(blueprint, DEFAULT_POOL)
+
+def init_app(app):
+    app.config.setdefault('WORKER_POOL', os.getenv('WORKER_POOL', ''))
+    app.config.setdefault('POOL_BLUEPRINTS', parse_pools(os.getenv('POOL_BLUEPRINTS', DEFAULT_POOL_BLUEPRINTS)))
+    # Pools only ever sit behind the proxy, which sets X-Forwarded-*; without
+    # ProxyFix every student would share the proxy's IP for rate limiting
+    app.config.setdefault('PROXY_FIX_HOPS', int(os.getenv('PROXY_FIX_HOPS', 1 if app.config['WORKER_POOL'] else 0)))
+
+    hops = app.config['PROXY_FIX_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops, x_port=hops, x_prefix=hops)
+
+    if not app.config['WORKER_POOL']:
+        return
+
+    @app.before_request
+    def check_pool():
+        # 421 rather than serving it: a misrouted request means the proxy and
+        # POOL_BLUEPRINTS disagree, and isolation would silently be gone
+        if request.endpoint is None or request.endpoint in SHARED_ENDPOINTS:
+            return
+        if pool_for(request.blueprint, app.config['POOL_BLUEPRINTS']) != app.config['WORKER_POOL']:
+            return Response(f"Misdirected request: this is the {app.config['WORKER_POOL']} pool.", 421,
+                            mimetype='text/plain')
@@ -0,0 +1,123 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+from flask_login import current_user
+from utils.disk_ring import DiskRing
+
+# Sampling profiler for a single request, switched on by an admin with
+# ?_profile=1 or an X-Profile: 1 header. Requests without the flag only pay
+# for one dict lookup.
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+def _frame_label(frame):
+    name, filename, line = frame
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+def collapsed_stacks(profile):
+    # Brendan Gregg's folded format, one "root;...;leaf count" line per stack
+    return '\n'.join(
+        ';'.join(_frame_label(frame) for frame in stack) + f' {count}'
+        for stack, count in profile['stacks']
+    ) + '\n'
+
+def speedscope(profile):
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in profile['stacks']:
+        indexes = []
+        for frame in map(tuple, stack):
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            indexes.append(index[frame])
+        samples.append(indexes)
+        weights.append(count * profile['interval'])
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': f"{profile['method']} {profile['path']}",
+        'exporter': 'messmate',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': profile['endpoint'] or profile['path'],
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+def _requested():
+    return request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+
+def init_app(app):
+    app.config.setdefault('PROFILER_INTERVAL', float(os.getenv('PROFILER_INTERVAL', 0.005)))
+    app.config.setdefault('PROFILER_DIR', os.getenv('PROFILER_DIR', os.path.join(app.instance_path, 'profiles')))
+    app.config.setdefault('PROFILER_KEEP', int(os.getenv('PROFILER_KEEP', 50)))
+    ring = DiskRing(app.config['PROFILER_DIR'], app.config['PROFILER_KEEP'])
+    app.extensions['profiles'] = ring
+
+    @app.before_request
+    def start_profiler():
+        if not _requested():
+            return
+        if not current_user.is_authenticated or current_user.role != 'admin':
+            return
+        g.profiler = Sampler(threading.get_ident(), app.config['PROFILER_INTERVAL'])
+        g.profiler_start = time.perf_counter()
+        g.profiler.start()
+
+    @app.after_request
+    def save_profile(response):
+        sampler = g.pop('profiler', None)
+        if sampler is None:
+            return response
+        samples = sampler.stop()
+        profile_id = ring.append({
+            'created_at': datetime.utcnow().isoformat(),
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.profiler_start) * 1000, 2),
+            'interval': app.config['PROFILER_INTERVAL'],
+            'sample_count': sum(samples.values()),
+            'stacks': [[list(stack), count] for stack, count in samples.most_common()],
+        })
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request doesn't run when the view raised
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            sampler.stop()
@@ -0,0 +1,37 @@
+from flask import current_app, request
+from flask_limiter.util import get_remote_address
+from flask_login import current_user
+
+# Weights for requests that are expensive to serve: a login hashes a
+# password and an export reads whole tables. The cost is charged against the
+# shared default budget and the endpoint's own limit (RATE_LIMIT_LOGIN,
+# RATE_LIMIT_EXPORT) alike. Unlisted endpoints cost 1. Entries are
+# endpoint=cost or endpoint:METHOD=cost.
+DEFAULT_COSTS = 'auth.login:POST=2,admin.export_data=5'
+
+def parse_costs(value):
+    costs = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        key, cost = entry.split('=', 1)
+        costs[key.strip()] = int(cost)
+    return costs
+
+def rate_limit_key():
+    # Students behind the campus NAT share an IP, so budget per account
+    if current_user.is_authenticated:
+        return f'user:{current_user.get_id()}'
+    return get_remote_address()
+
+def login_key():
+    # Login attempts are budgeted per account and address together: one
+    # student mistyping a password doesn't lock out the rest of the campus,
+    # and nobody can lock a student out from somewhere else
+    username = (request.form.get('username') or '').strip().lower()
+    return f'login:{username}:{get_remote_address()}'
+
+def request_cost():
+    costs = current_app.config['RATE_LIMIT_COSTS']
+    return costs.get(f'{request.endpoint}:{request.method}', costs.get(request.endpoint, 1))
+
+def config_limit(name):
+    return lambda: current_app.config[name]
@@ -0,0 +1,208 @@
+from datetime import datetime, time, timedelta
+import click
+from sqlalchemy import event, func, inspect, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, Meal, Payment, Subscription, MealRollup, RevenueRollup, RollupChange, RollupState
+
+# Per-day meal and revenue totals for the analytics page, so it reads one row
+# per day and dimension instead of scanning meals and payments.
+#
+# Every flush that touches a meal or payment logs the days it affects in
+# rollup_changes, inside the same transaction. refresh_rollups() recomputes
+# just those days and records the last change id it applied as the
+# watermark. Meals and payments from before the log existed are counted by
+# the migration that adds the rollups. Bulk query updates, manual SQL and
+# plan_type edits on a subscription bypass the log; `flask rebuild-rollups`
+# recomputes everything. Neither runs on a request.
+
+STATE_NAME = 'daily'
+REFRESH_LEASE = 60
+
+# Columns that decide which rollup row a meal or payment is counted in
+MEAL_COLUMNS = ('meal_date', 'meal_type', 'status', 'subscription_id')
+PAYMENT_COLUMNS = ('created_at', 'payment_type', 'status', 'amount', 'subscription_id')
+
+def _old_value(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+def _changed_days(obj, columns, day_attr, dirty):
+    if dirty and not any(inspect(obj).attrs[name].history.has_changes() for name in columns):
+        return set()
+    days = {getattr(obj, day_attr), _old_value(obj, day_attr)}
+    return {value.date() for value in days if value is not None}
+
+def changed_days(session):
+    changes = set()
+    for objects, dirty in ((session.new, False), (session.deleted, False), (session.dirty, True)):
+        for obj in objects:
+            if isinstance(obj, Meal):
+                changes.update(('meals', day) for day in _changed_days(obj, MEAL_COLUMNS, 'meal_date', dirty))
+            elif isinstance(obj, Payment):
+                changes.update(('revenue', day) for day in _changed_days(obj, PAYMENT_COLUMNS, 'created_at', dirty))
+    return changes
+
+def _log_changes(session, flush_context):
+    changes = changed_days(session)
+    if changes:
+        session.connection().execute(
+            RollupChange.__table__.insert(),
+            [{'kind': kind, 'day': day} for kind, day in sorted(changes)]
+        )
+
+def _meal_rows(*criteria):
+    day = func.date(Meal.meal_date)
+    status = func.coalesce(Meal.status, 'pending')
+    plan_type = func.coalesce(Subscription.plan_type, 'one-time')
+    return (
+        select(day, Meal.meal_type, status, plan_type, func.count(Meal.id))
+        .select_from(Meal).outerjoin(Subscription, Meal.subscription_id == Subscription.id)
+        .where(*criteria)
+        .group_by(day, Meal.meal_type, status, plan_type)
+    )
+
+def _revenue_rows(*criteria):
+    day = func.date(Payment.created_at)
+    status = func.coalesce(Payment.status, 'pending')
+    plan_type = func.coalesce(Subscription.plan_type, 'one-time')
+    return (
+        select(day, Payment.payment_type, status, plan_type, func.count(Payment.id), func.sum(Payment.amount))
+        .select_from(Payment).outerjoin(Subscription, Payment.subscription_id == Subscription.id)
+        .where(Payment.created_at.isnot(None), *criteria)
+        .group_by(day, Payment.payment_type, status, plan_type)
+    )
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite
+    return value if not isinstance(value, str) else datetime.strptime(value, '%Y-%m-%d').date()
+
+def _insert_rollups(kind, query):
+    rows = db.session.execute(query).all()
+    if not rows:
+        return 0
+    if kind == 'meals':
+        values = [dict(day=_as_date(day), meal_type=meal_type, status=status, plan_type=plan_type, meals=meals)
+                  for day, meal_type, status, plan_type, meals in rows]
+        db.session.execute(MealRollup.__table__.insert(), values)
+    else:
+        values = [dict(day=_as_date(day), payment_type=payment_type, status=status, plan_type=plan_type,
+                       payments=payments, amount=amount or 0)
+                  for day, payment_type, status, plan_type, payments, amount in rows]
+        db.session.execute(RevenueRollup.__table__.insert(), values)
+    return len(values)
+
+def recompute_day(kind, day):
+    model, query = (MealRollup, _meal_rows) if kind == 'meals' else (RevenueRollup, _revenue_rows)
+    column = Meal.meal_date if kind == 'meals' else Payment.created_at
+    start = datetime.combine(day, time.min)
+    db.session.execute(model.__table__.delete().where(model.__table__.c.day == day))
+    # A range on the raw column, so the index on it can be used
+    _insert_rollups(kind, query(column >= start, column < start + timedelta(days=1)))
+
+def _claim_refresh():
+    # Claimed with a conditional update on the state row, so only one worker
+    # or cron job refreshes at a time; a claim older than REFRESH_LEASE
+    # belongs to a process that died and is taken over. Returns the state
+    # row, or None if someone else holds the claim.
+    table = RollupState.__table__
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=REFRESH_LEASE)
+    claimed = db.session.execute(
+        table.update().where(table.c.name == STATE_NAME,
+                             or_(table.c.claimed_until.is_(None), table.c.claimed_until < now))
+        .values(claimed_until=until)
+    ).rowcount
+    if not claimed:
+        if db.session.scalar(select(table.c.name).where(table.c.name == STATE_NAME)) is not None:
+            db.session.commit()
+            return None
+        # First refresh on this database: the row is created already claimed
+        try:
+            db.session.execute(table.insert().values(name=STATE_NAME, watermark=0, claimed_until=until))
+        except IntegrityError:
+            db.session.rollback()
+            return None
+    db.session.commit()
+    return db.session.get(RollupState, STATE_NAME, populate_existing=True)
+
+def _save_state(state, watermark):
+    # Also gives up the claim, in the same transaction as the rollups
+    state.watermark = max(state.watermark or 0, watermark)
+    state.refreshed_at = datetime.utcnow()
+    state.claimed_until = None
+
+def _release(state):
+    db.session.rollback()
+    db.session.execute(RollupState.__table__.update().where(RollupState.name == STATE_NAME)
+                       .values(claimed_until=None))
+    db.session.commit()
+
+def _rebuild(state):
+    watermark = db.session.scalar(select(func.coalesce(func.max(RollupChange.id), 0)))
+    db.session.execute(MealRollup.__table__.delete())
+    db.session.execute(RevenueRollup.__table__.delete())
+    meal_rows = _insert_rollups('meals', _meal_rows())
+    revenue_rows = _insert_rollups('revenue', _revenue_rows())
+    # Changes logged after the rebuild started are applied by the next refresh
+    db.session.execute(RollupChange.__table__.delete().where(RollupChange.id <= watermark))
+    _save_state(state, watermark)
+    db.session.commit()
+    return meal_rows, revenue_rows
+
+def refresh_rollups():
+    # Returns the number of days recomputed. Cheap enough for the analytics
+    # page to call before reading: it only touches days in the change log.
+    state = _claim_refresh()
+    if state is None:
+        return 0  # another worker or the cron job is already on it
+    try:
+        changes = db.session.execute(select(RollupChange.id, RollupChange.kind, RollupChange.day)).all()
+        days = sorted({(kind, day) for _, kind, day in changes})
+        for kind, day in days:
+            recompute_day(kind, day)
+        # By id rather than "<= watermark": a transaction that committed late
+        # may have logged a lower id that wasn't visible above
+        ids = [change_id for change_id, _, _ in changes]
+        if ids:
+            db.session.execute(RollupChange.__table__.delete().where(RollupChange.id.in_(ids)))
+        _save_state(state, max(ids, default=0))
+        db.session.commit()
+        return len(days)
+    except Exception:
+        _release(state)
+        raise
+
+def rebuild_rollups():
+    # Returns (meal rows, revenue rows) written, or None if a refresh holds
+    # the claim
+    state = _claim_refresh()
+    if state is None:
+        return None
+    try:
+        return _rebuild(state)
+    except Exception:
+        _release(state)
+        raise
+
+def init_app(app):
+    if not event.contains(Session, 'after_flush', _log_changes):
+        event.listen(Session, 'after_flush', _log_changes)
+
+    @app.cli.command('refresh-rollups')
+    def refresh_rollups_command():
+        """Apply logged meal and payment changes to the analytics rollups."""
+        days = refresh_rollups()
+        click.echo(f'{days} day(s) recomputed.')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute the analytics rollups from every meal and payment."""
+        result = rebuild_rollups()
+        if result is None:
+            click.echo('A refresh is running; try again in a minute.')
+            return
+        meal_rows, revenue_rows = result
+        click.echo(f'{meal_rows} meal and {revenue_rows} revenue rollup row(s) written.')
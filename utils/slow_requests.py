@@ -0,0 +1,62 @@
+import os
+import resource
+from collections import Counter
+from datetime import datetime
+from flask import g
+from utils.disk_ring import DiskRing
+from utils.instrumentation import request_stats
+
+# Requests slower than SLOW_REQUEST_THRESHOLD_MS are kept whole: SQL
+# statements with their times, render time, Stripe/SMTP calls and the
+# worker's memory. Statements are only logged once a request has been
+# running for SLOW_REQUEST_LOG_AFTER_MS, and memory is only read for a
+# request that turned out slow, so fast requests pay for neither.
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss_kb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE // 1024
+    except OSError:
+        # No procfs (macOS): fall back to the peak, which only ever grows
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def endpoint_summary(records):
+    counts = Counter(record['endpoint'] or '-' for record in records)
+    return counts.most_common()
+
+def init_app(app):
+    app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 1000)))
+    app.config.setdefault('SLOW_REQUEST_DIR', os.getenv('SLOW_REQUEST_DIR', os.path.join(app.instance_path, 'slow_requests')))
+    app.config.setdefault('SLOW_REQUEST_KEEP', int(os.getenv('SLOW_REQUEST_KEEP', 200)))
+    app.config.setdefault('SLOW_REQUEST_MAX_STATEMENTS', int(os.getenv('SLOW_REQUEST_MAX_STATEMENTS', 500)))
+    app.config.setdefault('SLOW_REQUEST_LOG_AFTER_MS', float(
+        os.getenv('SLOW_REQUEST_LOG_AFTER_MS', app.config['SLOW_REQUEST_THRESHOLD_MS'] / 2)))
+    ring = DiskRing(app.config['SLOW_REQUEST_DIR'], app.config['SLOW_REQUEST_KEEP'])
+    app.extensions['slow_requests'] = ring
+
+    @app.before_request
+    def start_capture():
+        g.statement_log_after = app.config['SLOW_REQUEST_LOG_AFTER_MS'] / 1000
+        g.statement_log_limit = app.config['SLOW_REQUEST_MAX_STATEMENTS']
+
+    @app.after_request
+    def capture_slow_request(response):
+        stats = request_stats(response)
+        if stats is None or 'statement_log_after' not in g:
+            return response
+        if stats['total_ms'] < app.config['SLOW_REQUEST_THRESHOLD_MS']:
+            return response
+
+        statements = g.get('statement_log', [])
+        ring.append(dict(
+            stats,
+            created_at=datetime.utcnow().isoformat(),
+            rss_kb=current_rss_kb(),
+            statements=statements,
+            statements_after_ms=app.config['SLOW_REQUEST_LOG_AFTER_MS'],
+            statements_truncated=stats['db_statements'] > len(statements),
+            external_calls=g.get('external_calls', []),
+        ))
+        return response
@@ -0,0 +1,109 @@
+import os
+import time
+from flask import current_app, g, has_request_context, jsonify, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from sqlalchemy.exc import DBAPIError
+from models import db
+
+# Per-endpoint ceiling on how long any single SQL statement may run, so a
+# one-letter admin search can't hold a worker and a connection indefinitely.
+# SQLite gets a progress handler that aborts the statement once it's past
+# its deadline; PostgreSQL and MySQL get their own server-side timeouts.
+# Entries are endpoint=milliseconds.
+
+DEFAULT_DEADLINES = 'admin.manage_users=2000,admin.manage_refunds=2000,admin.analytics=5000,admin.analytics_api=5000,admin.export_data=30000'
+
+# SQLite calls the handler every this many virtual machine instructions
+PROGRESS_STEPS = 1000
+
+def parse_deadlines(value):
+    deadlines = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, ms = entry.split('=', 1)
+        deadlines[endpoint.strip()] = int(ms)
+    return deadlines
+
+def _current_deadline():
+    if not has_request_context():
+        return None
+    return g.get('statement_deadline_ms')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    deadline_ms = _current_deadline()
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        if deadline_ms:
+            # The handler stays on the connection until it goes back to the
+            # pool, so fetching the rows runs under the deadline as well as
+            # execute(); every statement only moves the deadline
+            deadline = conn.info.get('statement_deadline')
+            if deadline is None:
+                deadline = conn.info['statement_deadline'] = [0.0]
+                conn.connection.driver_connection.set_progress_handler(
+                    lambda: time.monotonic() > deadline[0] and _current_deadline() is not None,
+                    PROGRESS_STEPS)
+            deadline[0] = time.monotonic() + deadline_ms / 1000
+        return
+    # Server-side timeouts are session settings, so they're only touched when
+    # a pooled connection's current value is wrong for this request
+    timeout = deadline_ms or 0
+    if conn.info.get('statement_timeout_ms', 0) == timeout:
+        return
+    if dialect == 'postgresql':
+        cursor.execute(f'SET statement_timeout = {int(timeout)}')
+    elif dialect in ('mysql', 'mariadb'):
+        cursor.execute(f'SET SESSION max_execution_time = {int(timeout)}')
+    else:
+        return
+    conn.info['statement_timeout_ms'] = timeout
+
+def _checkin(dbapi_connection, connection_record):
+    # The request's session hands its connection back when the app context
+    # is torn down; the next user of it may have no deadline
+    if connection_record.info.pop('statement_deadline', None) is not None and dbapi_connection is not None:
+        dbapi_connection.set_progress_handler(None, PROGRESS_STEPS)
+
+def is_deadline_error(exc):
+    orig = getattr(exc, 'orig', None)
+    message = str(orig).lower()
+    if 'interrupted' in message:
+        return True  # sqlite3: progress handler aborted the statement
+    if getattr(orig, 'pgcode', None) == '57014' or 'canceling statement due to statement timeout' in message:
+        return True  # PostgreSQL query_canceled
+    return bool(getattr(orig, 'args', None)) and orig.args[0] == 3024  # MySQL
+
+def deadline_exceeded(exc):
+    if _current_deadline() is None or not is_deadline_error(exc):
+        raise exc
+    db.session.rollback()
+    current_app.logger.warning('Statement deadline of %s ms hit on %s', g.statement_deadline_ms, request.full_path)
+    message = 'That query took too long. Please narrow your filter and try again.'
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({'error': message}), 422
+    return render_template('errors/query_timeout.html', message=message), 422
+
+def init_app(app):
+    app.config.setdefault('STATEMENT_DEADLINES', parse_deadlines(
+        os.getenv('STATEMENT_DEADLINES', DEFAULT_DEADLINES)))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Pool, 'checkin', _checkin)
+
+    @app.before_request
+    def set_statement_deadline():
+        deadline_ms = app.config['STATEMENT_DEADLINES'].get(request.endpoint)
+        if deadline_ms:
+            g.statement_deadline_ms = deadline_ms
+
+    @app.after_request
+    def release_streamed_deadline(response):
+        # A streamed body (exports) is fetched as fast as the client reads
+        # it, and an aborted statement could no longer become a 422
+        if response.is_streamed:
+            g.pop('statement_deadline_ms', None)
+        return response
+
+    app.register_error_handler(DBAPIError, deadline_exceeded)
@@ -0,0 +1,64 @@
+import os
+import time
+import click
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+
+def warm_up(app):
+    # Compile every template now instead of on the first request that needs it
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except Exception:
+            app.logger.exception('Could not compile template %s', name)
+    return compiled
+
+def _fresh_env(app, bytecode_cache=None):
+    env = app.create_jinja_environment()
+    env.bytecode_cache = bytecode_cache
+    return env
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+def benchmark_templates(app):
+    results = []
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        cold = _timed(lambda: _fresh_env(app).get_template(name))
+        app.jinja_env.get_template(name)  # make sure the bytecode cache is populated
+        cached = _timed(lambda: _fresh_env(app, app.jinja_env.bytecode_cache).get_template(name))
+        # Render without the view's context: enough to measure the first hit
+        with app.test_request_context():
+            try:
+                render = _timed(lambda: render_template(name))
+            except Exception:
+                render = None
+        results.append((name, cold, cached, render))
+    return results
+
+def init_app(app):
+    cache_dir = app.config.setdefault(
+        'JINJA_BYTECODE_CACHE_DIR',
+        os.getenv('JINJA_BYTECODE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    # Stat-ing every template on every render is only useful while editing them
+    if not app.debug and not app.config.get('TEMPLATES_AUTO_RELOAD'):
+        app.jinja_env.auto_reload = False
+
+    if app.config.setdefault('TEMPLATE_WARMUP', os.getenv('TEMPLATE_WARMUP', 'True').lower() == 'true'):
+        warm_up(app)
+
+    @app.cli.command('bench-templates')
+    def bench_templates():
+        """Time cold compile, bytecode-cache load and first render per template."""
+        click.echo(f'{"template":<32} {"compile ms":>11} {"cached ms":>10} {"render ms":>10}')
+        for name, cold, cached, render in benchmark_templates(app):
+            render = f'{render:10.2f}' if render is not None else f'{"n/a":>10}'
+            click.echo(f'{name:<32} {cold:11.2f} {cached:10.2f} {render}')
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from extensions import cache
+from models import db, CacheInvalidation
+
+# Two tiers: a small LRU inside each worker, then the Flask-Caching backend
+# shared by all workers. Misses for the same key are computed once per worker
+# (single-flight) and, through a lease in the shared tier, usually once per
+# host. Entries past their TTL are still served for their stale window while
+# one thread recomputes them in the background.
+#
+# invalidate() writes to cache_invalidations; every worker polls that table
+# at most every TIERED_CACHE_SYNC_INTERVAL seconds and drops its local copies,
+# so an invalidation reaches all workers within that interval. Entries carry
+# the last invalidation id their worker had seen when it started computing,
+# and one that is older than its key's last synced invalidation is treated as
+# missing. That keeps hits free of queries. A worker syncs again just before
+# writing a computed value back, so it doesn't put a value computed from old
+# data in the shared tier after an invalidation, and a new worker starts from
+# the last invalidation of every key.
+# With CACHE_BACKEND=simple the "shared" tier and the lease are per worker,
+# so misses are computed once per worker rather than once per host.
+
+INVALIDATION_RETENTION = timedelta(days=1)
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class TieredCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.flights = {}
+        # Highest invalidation id seen, and the id of each key's last one;
+        # entries computed before that id are treated as missing
+        self.seen_seq = None
+        self.invalidated_at = {}
+        self.synced = 0.0
+        self.pid = None
+
+    def init_app(self, app):
+        app.config.setdefault('TIERED_CACHE_LOCAL_SIZE', int(os.getenv('TIERED_CACHE_LOCAL_SIZE', 256)))
+        app.config.setdefault('TIERED_CACHE_SYNC_INTERVAL', float(os.getenv('TIERED_CACHE_SYNC_INTERVAL', 1)))
+        app.config.setdefault('TIERED_CACHE_LEASE', float(os.getenv('TIERED_CACHE_LEASE', 30)))
+
+    def _reset_after_fork(self):
+        # Workers fork with the master's LRU but not its threads or locks
+        if self.pid != os.getpid():
+            self.lock = threading.Lock()
+            self.local.clear()
+            self.flights = {}
+            self.seen_seq = None
+            self.invalidated_at = {}
+            self.synced = 0.0
+            self.pid = os.getpid()
+
+    def _sync(self, force=False):
+        config = current_app.config
+        if not force and time.monotonic() - self.synced < config['TIERED_CACHE_SYNC_INTERVAL']:
+            return
+        self.synced = time.monotonic()
+        table = CacheInvalidation.__table__
+        with db.engine.connect() as conn:
+            if self.seen_seq is None:
+                rows = conn.execute(
+                    select(func.max(table.c.id), table.c.key).group_by(table.c.key).order_by(func.max(table.c.id))
+                ).all()
+            else:
+                rows = conn.execute(
+                    select(table.c.id, table.c.key).where(table.c.id > self.seen_seq).order_by(table.c.id)
+                ).all()
+        with self.lock:
+            self.seen_seq = self.seen_seq or 0
+            for seq, key in rows:
+                self.local.pop(key, None)
+                self.invalidated_at[key] = max(seq, self.invalidated_at.get(key, 0))
+                self.seen_seq = max(seq, self.seen_seq)
+
+    def _usable(self, key, entry):
+        return entry is not None and entry['seq'] >= self.invalidated_at.get(key, 0)
+
+    def _local_get(self, key):
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                self.local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, entry):
+        with self.lock:
+            if not self._usable(key, entry):
+                return  # invalidated while it was being computed
+            self.local[key] = entry
+            self.local.move_to_end(key)
+            while len(self.local) > current_app.config['TIERED_CACHE_LOCAL_SIZE']:
+                self.local.popitem(last=False)
+
+    def get_or_compute(self, key, compute, ttl, stale_ttl=0):
+        self._reset_after_fork()
+        self._sync()
+        now = time.time()
+        entry = self._local_get(key)
+        if not self._usable(key, entry) or entry['stale_until'] <= now:
+            entry = cache.get(key)
+            if entry is not None and entry['stale_until'] > now and self._usable(key, entry):
+                self._local_set(key, entry)
+            else:
+                entry = None
+
+        if entry is None:
+            return self._single_flight(key, compute, ttl, stale_ttl)
+        if entry['fresh_until'] <= now:
+            self._refresh_in_background(key, compute, ttl, stale_ttl)
+        return entry['value']
+
+    def _single_flight(self, key, compute, ttl, stale_ttl):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._compute(key, compute, ttl, stale_ttl)
+            return flight.value
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+    def _compute(self, key, compute, ttl, stale_ttl):
+        # Other workers may be missing the same key; the one holding the
+        # lease computes and the rest wait for its result to land
+        lease_key = f'{key}:lease'
+        lease = current_app.config['TIERED_CACHE_LEASE']
+        leased = cache.add(lease_key, os.getpid(), timeout=int(lease) or 1)
+        if not leased:
+            deadline = time.monotonic() + lease
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if entry is not None and entry['fresh_until'] > time.time() and self._usable(key, entry):
+                    self._local_set(key, entry)
+                    return entry['value']
+        try:
+            seq = self.seen_seq or 0
+            value = compute()
+            self._sync(force=True)
+            now = time.time()
+            entry = {'value': value, 'fresh_until': now + ttl, 'stale_until': now + ttl + stale_ttl, 'seq': seq}
+            if self._usable(key, entry):
+                cache.set(key, entry, timeout=int(ttl + stale_ttl) or 1)
+                self._local_set(key, entry)
+            return value
+        finally:
+            if leased:
+                cache.delete(lease_key)
+
+    def _refresh_in_background(self, key, compute, ttl, stale_ttl):
+        with self.lock:
+            if key in self.flights:
+                return
+            flight = self.flights[key] = Flight()
+        app = current_app._get_current_object()
+
+        def refresh():
+            with app.app_context():
+                try:
+                    flight.value = self._compute(key, compute, ttl, stale_ttl)
+                except Exception as exc:
+                    flight.error = exc
+                    app.logger.exception('Background refresh of %s failed', key)
+                finally:
+                    with self.lock:
+                        self.flights.pop(key, None)
+                    flight.done.set()
+
+        threading.Thread(target=refresh, name=f'cache-refresh:{key}', daemon=True).start()
+
+    def invalidate(self, key):
+        self._reset_after_fork()
+        table = CacheInvalidation.__table__
+        with db.engine.begin() as conn:
+            seq = conn.execute(table.insert().values(key=key, created_at=datetime.utcnow())).inserted_primary_key[0]
+            conn.execute(table.delete().where(table.c.created_at < datetime.utcnow() - INVALIDATION_RETENTION))
+        cache.delete(key)
+        with self.lock:
+            self.local.pop(key, None)
+            self.invalidated_at[key] = max(seq, self.invalidated_at.get(key, 0))
+
+tiered_cache = TieredCache()
+
+def init_app(app):
+    tiered_cache.init_app(app)
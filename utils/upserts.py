@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+# INSERT ... ON CONFLICT DO UPDATE in one statement, so two transactions that
+# both find a row missing can't both insert it. Other databases fall back to
+# update, then insert if nothing was updated.
+
+DIALECT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def add_to_row(connection, table, key, column, amount):
+    # Adds amount to the row's column, creating the row with amount if missing
+    key_column = list(table.primary_key.columns)[0]
+    insert = DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        result = connection.execute(
+            table.update().where(key_column == key).values({column: table.c[column] + amount}))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values({key_column.name: key, column: amount}))
+        return
+    statement = insert(table).values({key_column.name: key, column: amount})
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={column: table.c[column] + statement.excluded[column]},
+    ))
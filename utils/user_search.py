@@ -0,0 +1,101 @@
+import click
+from sqlalchemy import event, literal_column, select, text
+from models import db, User
+
+# Admin user search. A '%term%' LIKE can't use an index, so on SQLite users
+# are also indexed in user_search, an FTS5 table with the trigram tokenizer:
+# any substring of three or more characters of a username or email is an
+# index lookup, and results come back ranked by bm25. Triggers on users keep
+# it in step with every insert, update and delete, including ones made
+# outside the app.
+#
+# On PostgreSQL the same job is done by pg_trgm GIN indexes, which LIKE and
+# ILIKE use directly, so the query stays a plain ILIKE there. Terms shorter
+# than three characters have no trigrams and fall back to ILIKE everywhere.
+
+MIN_TERM_LENGTH = 3
+
+SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        username, email, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON users BEGIN
+        INSERT INTO user_search (rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON users BEGIN
+        INSERT INTO user_search (user_search, rowid, username, email)
+        VALUES ('delete', old.id, old.username, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_update AFTER UPDATE OF username, email ON users BEGIN
+        INSERT INTO user_search (user_search, rowid, username, email)
+        VALUES ('delete', old.id, old.username, old.email);
+        INSERT INTO user_search (rowid, username, email) VALUES (new.id, new.username, new.email);
+    END""",
+)
+
+POSTGRESQL_DDL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)',
+)
+
+# Whether user_search exists, per database URL; checked once per process
+_index_ready = {}
+
+def create_search_index(connection):
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRESQL_DDL}.get(connection.dialect.name, ())
+    for statement in statements:
+        connection.execute(text(statement))
+    return bool(statements)
+
+def rebuild_search_index():
+    # Creates the index on an existing database and reindexes every user
+    with db.engine.begin() as conn:
+        if not create_search_index(conn):
+            return False
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text("INSERT INTO user_search (user_search) VALUES ('rebuild')"))
+    _index_ready.pop(str(db.engine.url), None)
+    return True
+
+def _after_create(target, connection, **kw):
+    create_search_index(connection)
+
+def search_index_ready():
+    url = str(db.engine.url)
+    if not _index_ready.get(url):
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        _index_ready[url] = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+        ).first() is not None
+    return _index_ready[url]
+
+def match_expression(term):
+    # One quoted phrase, so the term is matched as a literal substring
+    return '"' + term.replace('"', '""') + '"'
+
+def search_users(query, term):
+    # Filters a User query by term, ranked best match first when indexed
+    term = term.strip()
+    if len(term) >= MIN_TERM_LENGTH and search_index_ready():
+        matches = (
+            select(literal_column('rowid').label('user_id'), literal_column('rank').label('rank'))
+            .select_from(text('user_search'))
+            .where(text('user_search MATCH :term').bindparams(term=match_expression(term)))
+            .subquery()
+        )
+        return query.join(matches, User.id == matches.c.user_id).order_by(matches.c.rank)
+    return query.filter(User.username.ilike(f'%{term}%') | User.email.ilike(f'%{term}%'))
+
+def init_app(app):
+    if not event.contains(User.__table__, 'after_create', _after_create):
+        event.listen(User.__table__, 'after_create', _after_create)
+
+    @app.cli.command('rebuild-user-search')
+    def rebuild_user_search_command():
+        """Create the user search index if it's missing and reindex every user."""
+        if rebuild_search_index():
+            click.echo('User search index rebuilt.')
+        else:
+            click.echo(f'No search index for {db.engine.dialect.name}; searches use ILIKE.')
@@ -0,0 +1,71 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db, User, Meal, Subscription, Payment, MealPlan, RefundRequest, DataVersion
+from utils.upserts import add_to_row
+
+# Rows owned by a single user also bump that user's scope
+USER_OWNED = (Meal, Subscription, Payment, RefundRequest)
+
+# Columns whose changes never show up on a page or in an export
+IGNORED_COLUMNS = {'last_login'}
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+def get_version(scope):
+    row = db.session.get(DataVersion, scope)
+    return row.version if row else 0
+
+def get_versions(scopes):
+    if not scopes:
+        return {}
+    rows = DataVersion.query.filter(DataVersion.scope.in_(scopes)).all()
+    versions = {scope: 0 for scope in scopes}
+    versions.update({row.scope: row.version for row in rows})
+    return versions
+
+def _has_relevant_changes(obj):
+    state = inspect(obj)
+    for attr in state.mapper.column_attrs:
+        if attr.key in IGNORED_COLUMNS:
+            continue
+        if state.attrs[attr.key].history.has_changes():
+            return True
+    return False
+
+def _scopes_for(obj):
+    if isinstance(obj, User):
+        return {'users', user_scope(obj.id)}
+    if isinstance(obj, USER_OWNED):
+        return {obj.__tablename__, user_scope(obj.user_id)}
+    if isinstance(obj, MealPlan):
+        return {'meal_plans'}
+    return set()
+
+def changed_scopes(session):
+    scopes = set()
+    for obj in session.new:
+        scopes |= _scopes_for(obj)
+    for obj in session.deleted:
+        scopes |= _scopes_for(obj)
+    for obj in session.dirty:
+        if _has_relevant_changes(obj):
+            scopes |= _scopes_for(obj)
+    return scopes
+
+def bump_versions(connection, scopes):
+    table = DataVersion.__table__
+    # Sorted so concurrent writers take row locks in the same order
+    for scope in sorted(scopes):
+        add_to_row(connection, table, scope, 'version', 1)
+
+def _bump_scopes(session, flush_context):
+    # new/dirty/deleted and attribute history still hold their pre-flush
+    # state here, and freshly inserted rows already have their ids
+    scopes = changed_scopes(session)
+    if scopes:
+        bump_versions(session.connection(), scopes)
+
+def init_app(app):
+    if not event.contains(Session, 'after_flush', _bump_scopes):
+        event.listen(Session, 'after_flush', _bump_scopes)